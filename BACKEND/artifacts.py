@@ -0,0 +1,159 @@
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+try:
+    from . import config
+except ImportError:
+    import config
+
+JOBS_DIR = config.get("JOBS_DIR", "JOBS")
+JOB_TTL_SECONDS = float(config.get("JOB_TTL_HOURS", "24")) * 3600
+JOB_QUOTA_BYTES = int(float(config.get("JOB_QUOTA_MB", "2048")) * 1024 * 1024)
+SWEEP_INTERVAL_SECONDS = float(config.get("JOB_SWEEP_INTERVAL_SECONDS", "600"))
+
+# Jobs younger than this are never evicted for quota, so a running job keeps its files
+MIN_JOB_AGE_SECONDS = 600
+
+_sweeper_thread = None
+_sweeper_lock = threading.Lock()
+
+
+def new_job_id():
+    """Returns a fresh, unique job ID."""
+    return uuid.uuid4().hex
+
+
+def job_dir(job_id, create=True, base_dir=None):
+    """
+    Returns the artifact directory for a job, creating it by default. It lives under
+    JOBS_DIR, where the sweeper expires it, unless another base_dir is given.
+    """
+    path = os.path.join(base_dir or JOBS_DIR, job_id)
+    if create:
+        os.makedirs(path, exist_ok=True)
+    return path
+
+
+def panel_path(job_id, index, base_dir=None):
+    """Returns the path of a panel image (index is zero-based) inside a job directory."""
+    return os.path.join(job_dir(job_id, base_dir=base_dir), f"panel_{index+1}.png")
+
+
+def job_paths(job_id, base_dir=None):
+    """Returns the standard artifact paths of a job (see job_dir for base_dir)."""
+    directory = job_dir(job_id, base_dir=base_dir)
+    return {
+        "dir": directory,
+        "comic": os.path.join(directory, "comic_strip_with_text.png"),
+        "pdf": os.path.join(directory, "comic_strip.pdf"),
+        "preview": os.path.join(directory, "preview.jpg"),
+        "slices": os.path.join(directory, "slices"),
+        "state": os.path.join(directory, "job.json"),
+    }
+
+
+def write_state(job_id, state):
+    """Saves a job's JSON state (its script and options) atomically, so it can be edited later."""
+    path = job_paths(job_id)["state"]
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+def read_state(job_id):
+    """Returns a job's saved state, or None if the job is unknown or was swept."""
+    path = os.path.join(job_dir(job_id, create=False), "job.json")
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def touch_job(job_id):
+    """Marks a job as recently used so the sweeper keeps it."""
+    path = job_dir(job_id, create=False)
+    if os.path.isdir(path):
+        os.utime(path)
+
+
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def sweep(max_age=JOB_TTL_SECONDS, max_bytes=JOB_QUOTA_BYTES):
+    """
+    Deletes job directories older than max_age, then the oldest remaining jobs
+    until the total size is under max_bytes. Returns the removed job IDs.
+    """
+    if not os.path.isdir(JOBS_DIR):
+        return []
+
+    now = time.time()
+    jobs = []
+    for name in os.listdir(JOBS_DIR):
+        path = os.path.join(JOBS_DIR, name)
+        if not os.path.isdir(path):
+            continue
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            continue
+        jobs.append((mtime, name, path, _dir_size(path)))
+
+    removed = []
+    kept = []
+    for mtime, name, path, size in sorted(jobs):
+        if max_age is not None and now - mtime > max_age:
+            shutil.rmtree(path, ignore_errors=True)
+            removed.append(name)
+        else:
+            kept.append((mtime, name, path, size))
+
+    if max_bytes is not None:
+        total = sum(size for _, _, _, size in kept)
+        for mtime, name, path, size in kept:
+            if total <= max_bytes:
+                break
+            if now - mtime < MIN_JOB_AGE_SECONDS:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            removed.append(name)
+            total -= size
+
+    if removed:
+        print(f"Artifact sweeper removed {len(removed)} job(s) from {JOBS_DIR}")
+    return removed
+
+
+def _sweep_forever(interval):
+    while True:
+        try:
+            sweep()
+        except Exception as e:
+            print(f"Artifact sweeper error: {e}")
+        time.sleep(interval)
+
+
+def start_sweeper(interval=SWEEP_INTERVAL_SECONDS):
+    """Starts the background sweeper thread once per process."""
+    global _sweeper_thread
+    with _sweeper_lock:
+        if _sweeper_thread is None or not _sweeper_thread.is_alive():
+            _sweeper_thread = threading.Thread(
+                target=_sweep_forever, args=(interval,), name="artifact-sweeper", daemon=True
+            )
+            _sweeper_thread.start()
+    return _sweeper_thread
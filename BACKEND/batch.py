@@ -0,0 +1,281 @@
+"""
+Renders many comics from a JSONL file, several at a time.
+
+Each input line is a JSON object:
+    {"id": "rooftop-chase", "prompt": "A detective chases a thief...", "style": "Anime",
+     "vertical": false, "include_text": true, "formats": ["png", "webp"], "slices": false}
+Only "prompt" is required; "id" defaults to a hash of the line's options, and the
+rest to the command-line defaults. "slices" also cuts a vertical strip into
+panel-sized images with a lazy-loading strip.html, in the comic's slices/ directory.
+
+Every comic gets its own directory under --output-dir holding its script
+(script.json), its panel images and its outputs. Finished comics are appended to
+manifest.jsonl there, with their output paths and per-stage timings. Running the
+same batch again resumes it: comics already in the manifest as "done" are skipped,
+and unfinished ones reuse the script and panel images already on disk, so a crash
+never costs more than the requests that were in flight.
+
+Usage, from the repository root:
+    python -m BACKEND.batch prompts.jsonl --output-dir BATCH --comics 8 --image-concurrency 12
+"""
+import argparse
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from PIL import Image
+
+try:
+    from . import artifacts, compose_pool, generate_image, generate_panels, metrics, pipeline
+    from .disk_cache import make_key
+except ImportError:
+    import artifacts
+    import compose_pool
+    import generate_image
+    import generate_panels
+    import metrics
+    import pipeline
+    from disk_cache import make_key
+
+DEFAULT_OUTPUT_DIR = "BATCH"
+MANIFEST_NAME = "manifest.jsonl"
+SCRIPT_NAME = "script.json"
+
+
+def read_items(path, default_style="Anime"):
+    """Reads a JSONL batch file into a list of normalized items. Raises ValueError on bad lines."""
+    items = []
+    seen = set()
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                raw = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"Line {line_number}: invalid JSON ({e}).")
+            prompt = (raw.get("prompt") or raw.get("scenario") or "").strip()
+            if not prompt:
+                raise ValueError(f"Line {line_number}: a \"prompt\" is required.")
+
+            item = {
+                "prompt": prompt,
+                "style": raw.get("style", default_style),
+                "vertical": bool(raw.get("vertical", False)),
+                "include_text": bool(raw.get("include_text", True)),
+                "formats": raw.get("formats"),
+            }
+            if item["style"] not in generate_image.STYLE_MAPPINGS:
+                raise ValueError(
+                    f"Line {line_number}: invalid art style! Choose from: {', '.join(generate_image.STYLE_MAPPINGS.keys())}."
+                )
+            # The default ID only depends on the options, so it stays the same when the batch is resumed
+            item_id = str(raw.get("id") or make_key(*(item[key] for key in sorted(item)))[:16])
+            item["id"] = re.sub(r"[^A-Za-z0-9_.-]", "_", item_id)
+            # Added after the ID, which stays the same whether or not a strip is sliced
+            item["slices"] = bool(raw.get("slices", False))
+            if item["id"] in seen:
+                raise ValueError(f"Line {line_number}: duplicate id {item['id']!r}.")
+            seen.add(item["id"])
+            items.append(item)
+    return items
+
+
+def read_manifest(path):
+    """Returns the latest manifest record of every comic, keyed by ID."""
+    records = {}
+    if not os.path.exists(path):
+        return records
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A line cut short by a crash
+                continue
+            records[record["id"]] = record
+    return records
+
+
+def load_script(item_id, output_dir=DEFAULT_OUTPUT_DIR):
+    """Returns the panel script saved for a comic by an earlier run, or None."""
+    path = os.path.join(artifacts.job_dir(item_id, base_dir=output_dir), SCRIPT_NAME)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            panels = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return panels if len(panels) == pipeline.PANEL_COUNT else None
+
+
+def save_script(item_id, panels, output_dir=DEFAULT_OUTPUT_DIR):
+    path = os.path.join(artifacts.job_dir(item_id, base_dir=output_dir), SCRIPT_NAME)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(panels, f)
+    os.replace(tmp_path, path)
+
+
+def load_panel_image(item_id, index, output_dir=DEFAULT_OUTPUT_DIR):
+    """Returns a panel image saved by an earlier run, or None if it is missing or truncated."""
+    path = artifacts.panel_path(item_id, index, base_dir=output_dir)
+    if not os.path.exists(path):
+        return None
+    try:
+        image = Image.open(path)
+        image.load()
+    except OSError:
+        return None
+    return image
+
+
+def run_item(item, image_pool, llm_slots, use_cache=True, output_dir=DEFAULT_OUTPUT_DIR):
+    """
+    Renders one comic into its directory under output_dir, reusing whatever an earlier
+    run left there. Returns its manifest record.
+    """
+    item_id = item["id"]
+    started = time.perf_counter()
+    timings = {}
+
+    # Step 1: the panel script, from disk or from the LLM (at most llm_slots calls at once)
+    panel_data = load_script(item_id, output_dir)
+    if panel_data is None:
+        with llm_slots:
+            panel_data = generate_panels.generate_panels(item["prompt"], item["style"], use_cache=use_cache)
+        if len(panel_data) != pipeline.PANEL_COUNT:
+            raise Exception(f"Expected {pipeline.PANEL_COUNT} panels, but the script has {len(panel_data)}.")
+        save_script(item_id, panel_data, output_dir)
+    timings["panels"] = time.perf_counter() - started
+
+    # Step 2: only the panels without an image on disk go to the shared image pool
+    mark = time.perf_counter()
+    panel_images = [load_panel_image(item_id, i, output_dir) for i in range(len(panel_data))]
+    resumed_panels = sum(1 for image in panel_images if image is not None)
+    futures = {
+        image_pool.submit(
+            generate_image.generate_panel_image, i, panel, item["style"],
+            use_cache, True, artifacts.job_dir(item_id, base_dir=output_dir)
+        ): i
+        for i, panel in enumerate(panel_data) if panel_images[i] is None
+    }
+    errors = []
+    for future in as_completed(futures):
+        i = futures[future]
+        try:
+            panel_images[i] = future.result()["Image"]
+        except Exception as e:
+            errors.append(f"panel {i+1}: {e}")
+    if errors:
+        raise Exception(f"Failed to generate all panel images ({'; '.join(sorted(errors))}).")
+    timings["images"] = time.perf_counter() - mark
+
+    # Steps 3 & 4: compose and export exactly as the app does, on the composition process pool
+    paths = artifacts.job_paths(item_id, base_dir=output_dir)
+    outputs, seconds = compose_pool.submit(
+        pipeline.compose_and_export, panel_images, panel_data, paths,
+        item["include_text"], item["vertical"], item["formats"], True, item["slices"]
+    ).result()
+    timings.update(seconds)
+    timings["total"] = time.perf_counter() - started
+
+    return {"id": item_id, "status": "done", "outputs": outputs, "timings": timings, "resumed_panels": resumed_panels}
+
+
+def run_batch(items, output_dir=DEFAULT_OUTPUT_DIR, comic_workers=8, image_workers=12, llm_workers=4, use_cache=True):
+    """
+    Renders every item not yet marked done in output_dir's manifest, with at most
+    comic_workers comics, image_workers ClipDrop calls and llm_workers OpenRouter
+    calls in flight across the whole batch. Returns a summary dictionary.
+    """
+    # Batch outputs are kept for good, so every comic's directory is under output_dir,
+    # outside the JOBS directory the sweeper expires
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    done = {item_id for item_id, record in read_manifest(manifest_path).items() if record["status"] == "done"}
+    pending = [item for item in items if item["id"] not in done]
+    print(f"{len(items)} comics in batch, {len(items) - len(pending)} already done, {len(pending)} to render.")
+
+    # Size the shared clients' connection pools for the whole batch, so every request reuses a connection
+    generate_image.CLIENT.configure(pool_size=image_workers)
+    generate_panels.CLIENT.configure(pool_size=llm_workers)
+
+    manifest_lock = threading.Lock()
+    llm_slots = threading.Semaphore(max(1, llm_workers))
+    counts = {"done": 0, "failed": 0}
+    started = time.perf_counter()
+
+    def record(entry):
+        entry["finished_at"] = time.time()
+        with manifest_lock:
+            with open(manifest_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            counts[entry["status"]] += 1
+            finished = counts["done"] + counts["failed"]
+        metrics.count("comic_comics_total", status=entry["status"])
+        print(f"[{finished}/{len(pending)}] {entry['id']}: {entry['status']}"
+              + (f" in {entry['timings']['total']:.1f}s" if entry["status"] == "done" else f" ({entry['error']})"))
+
+    def work(item):
+        try:
+            entry = run_item(item, image_pool, llm_slots, use_cache, output_dir)
+        except Exception as e:
+            entry = {"id": item["id"], "status": "failed", "error": str(e)}
+        entry.update(prompt=item["prompt"], style=item["style"])
+        record(entry)
+
+    with ThreadPoolExecutor(max_workers=max(1, image_workers), thread_name_prefix="batch-image") as image_pool:
+        with ThreadPoolExecutor(max_workers=max(1, comic_workers), thread_name_prefix="batch-comic") as comic_pool:
+            for future in [comic_pool.submit(work, item) for item in pending]:
+                future.result()
+
+    elapsed = time.perf_counter() - started
+    summary = {
+        "total": len(items),
+        "skipped": len(items) - len(pending),
+        "done": counts["done"],
+        "failed": counts["failed"],
+        "seconds": elapsed,
+        "comics_per_hour": counts["done"] * 3600 / elapsed if elapsed else 0.0,
+        "manifest": manifest_path,
+    }
+    metrics.write_textfile()
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render many comics from a JSONL file of prompts.")
+    parser.add_argument("input", help="JSONL file, one comic per line")
+    parser.add_argument("--output-dir", default=DEFAULT_OUTPUT_DIR)
+    parser.add_argument("--style", default="Anime", help="Art style for lines that don't set one")
+    parser.add_argument("--comics", type=int, default=8, help="Comics rendered at the same time")
+    parser.add_argument("--image-concurrency", type=int, default=12, help="ClipDrop requests in flight across the batch")
+    parser.add_argument("--llm-concurrency", type=int, default=4, help="OpenRouter requests in flight across the batch")
+    parser.add_argument("--no-cache", action="store_true", help="Don't reuse cached scripts and images")
+    args = parser.parse_args()
+
+    try:
+        items = read_items(args.input, args.style)
+    except ValueError as e:
+        parser.error(str(e))
+
+    summary = run_batch(
+        items, args.output_dir, comic_workers=args.comics, image_workers=args.image_concurrency,
+        llm_workers=args.llm_concurrency, use_cache=not args.no_cache
+    )
+    print(
+        f"\nBatch finished: {summary['done']} done, {summary['failed']} failed, {summary['skipped']} skipped "
+        f"in {summary['seconds']:.1f}s ({summary['comics_per_hour']:.0f} comics/hour). Manifest: {summary['manifest']}"
+    )
+    if summary["failed"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
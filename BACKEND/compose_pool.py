@@ -0,0 +1,153 @@
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context, shared_memory
+
+from PIL import Image
+
+try:
+    from . import config, metrics
+except ImportError:
+    import config
+    import metrics
+
+# Worker processes for CPU-bound composition and encoding; 0 runs everything in the calling thread
+COMPOSE_WORKERS = int(config.get("COMPOSE_WORKERS", str(os.cpu_count() or 1)))
+
+_executor = None
+_lock = threading.Lock()
+_in_worker = False
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            # spawn, not fork: the app process runs threads (jobs, exports, Streamlit) that fork would copy mid-flight
+            _executor = ProcessPoolExecutor(
+                max_workers=COMPOSE_WORKERS, mp_context=get_context("spawn"), initializer=_init_worker
+            )
+        return _executor
+
+
+def _discard_executor(executor):
+    """Forgets a pool whose worker died (OOM kill, crash in Pillow), so the next call starts a fresh one."""
+    global _executor
+    with _lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False)
+
+
+def _init_worker():
+    global _in_worker
+    _in_worker = True
+
+
+def share_image(image):
+    """Copies an image's RGB pixels into a new shared memory block. Returns (block, descriptor)."""
+    if not isinstance(image, Image.Image):
+        image = Image.open(image)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    data = image.tobytes()
+    block = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+    block.buf[:len(data)] = data
+    return block, (block.name, image.size)
+
+
+def attach_image(descriptor):
+    """Rebuilds an image from a share_image descriptor, in any process."""
+    name, size = descriptor
+    # Pool workers share the parent's resource tracker, so attaching doesn't take
+    # ownership: the block is still unlinked exactly once, by the process that created it
+    block = shared_memory.SharedMemory(name=name)
+    view = block.buf[:size[0] * size[1] * 3]
+    try:
+        return Image.frombytes("RGB", size, view)
+    finally:
+        view.release()
+        block.close()
+
+
+def _run(fn, descriptors, args):
+    metrics.reset()
+    panel_images = [attach_image(descriptor) for descriptor in descriptors]
+    return fn(panel_images, *args), metrics.snapshot()
+
+
+def submit(fn, panel_images, *args):
+    """
+    Runs fn(panel_images, *args) in the composition process pool and returns a Future
+    of its result. The panel images travel through shared memory rather than being
+    pickled; fn must be a module-level function and should return something small
+    (paths, timings), not images. Metrics recorded by fn are merged into this process.
+    With COMPOSE_WORKERS=0, or when already inside a worker, fn runs right here.
+    """
+    if COMPOSE_WORKERS <= 0 or _in_worker:
+        future = Future()
+        try:
+            future.set_result(fn(list(panel_images), *args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    blocks = []
+    try:
+        descriptors = []
+        for image in panel_images:
+            block, descriptor = share_image(image)
+            blocks.append(block)
+            descriptors.append(descriptor)
+        outer = Future()
+        _start(outer, blocks, fn, descriptors, args, retries=1)
+    except Exception:
+        _release(blocks)
+        raise
+    return outer
+
+
+def _start(outer, blocks, fn, descriptors, args, retries):
+    """
+    Submits one job to the pool. A pool broken by a dead worker is replaced and the job
+    resubmitted once; if the fresh pool breaks too, only this job fails.
+    """
+    executor = _get_executor()
+    try:
+        inner = executor.submit(_run, fn, descriptors, args)
+    except BrokenProcessPool:
+        _discard_executor(executor)
+        if retries <= 0:
+            raise
+        return _start(outer, blocks, fn, descriptors, args, retries - 1)
+
+    def finish(inner):
+        try:
+            result, worker_metrics = inner.result()
+        except BrokenProcessPool as e:
+            _discard_executor(executor)
+            error = e
+            if retries > 0:
+                try:
+                    _start(outer, blocks, fn, descriptors, args, retries - 1)
+                    return
+                except Exception as e:
+                    error = e
+        except Exception as e:
+            error = e
+        else:
+            _release(blocks)
+            metrics.merge(worker_metrics)
+            outer.set_result(result)
+            return
+        _release(blocks)
+        outer.set_exception(error)
+
+    inner.add_done_callback(finish)
+
+
+def _release(blocks):
+    for block in blocks:
+        block.close()
+        block.unlink()
@@ -0,0 +1,35 @@
+import os
+import threading
+from functools import lru_cache
+
+_required = {}
+_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def load_env():
+    """Loads the .env file into os.environ, once per process. Variables that are already set win."""
+    from dotenv import load_dotenv
+
+    return load_dotenv()
+
+
+def get(name, default=None):
+    """Returns a setting from the environment (or .env), like os.getenv."""
+    load_env()
+    return os.getenv(name, default)
+
+
+def require(name):
+    """
+    Returns a setting that must be present, such as an API key, checking it the first
+    time it is actually needed rather than at import. Raises ValueError if it is missing.
+    """
+    value = _required.get(name)
+    if value is None:
+        value = get(name)
+        if not value:
+            raise ValueError(f"{name} environment variable is not set. Please set it in your .env file.")
+        with _lock:
+            _required[name] = value
+    return value
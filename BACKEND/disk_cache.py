@@ -0,0 +1,123 @@
+import hashlib
+import os
+import threading
+import time
+
+
+def make_key(*parts):
+    """Returns a stable SHA-256 content hash for the given key parts."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class DiskCache:
+    """
+    Content-addressed file cache with a size limit, an age limit and LRU eviction.
+    Entries are plain files named after their key; a hit refreshes the file's
+    modification time, which is what eviction orders by.
+    """
+
+    def __init__(self, directory, max_bytes=None, max_age=None, suffix=".bin"):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.suffix = suffix
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + self.suffix)
+
+    def _is_expired(self, mtime):
+        return self.max_age is not None and time.time() - mtime > self.max_age
+
+    def get(self, key):
+        """Returns the cached bytes for `key`, or None on a miss."""
+        path = self._path(key)
+        try:
+            if self._is_expired(os.path.getmtime(path)):
+                os.remove(path)
+                raise FileNotFoundError(path)
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key, data):
+        """Stores `data` under `key`, then evicts entries over the size limit."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def _entries(self):
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(self.suffix):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def evict(self):
+        """Removes expired entries, then least recently used ones until under max_bytes."""
+        with self._lock:
+            entries = []
+            for mtime, size, path in self._entries():
+                if self._is_expired(mtime):
+                    _remove_quietly(path)
+                else:
+                    entries.append((mtime, size, path))
+
+            if self.max_bytes is None:
+                return
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                _remove_quietly(path)
+                total -= size
+
+    def clear(self):
+        """Removes every entry in the cache."""
+        with self._lock:
+            for _, _, path in self._entries():
+                _remove_quietly(path)
+
+    def stats(self):
+        """Returns hit/miss counters and the current size of the cache."""
+        entries = self._entries()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+        }
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
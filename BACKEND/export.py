@@ -0,0 +1,338 @@
+import io
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from PIL import Image
+
+try:
+    from . import config, metrics
+except ImportError:
+    import config
+    import metrics
+
+# Encoder settings per output format; any of them can be overridden per call
+OUTPUT_FORMATS = {
+    "png": {
+        "format": "PNG",
+        "extension": "png",
+        "mime": "image/png",
+        "options": {"compress_level": int(config.get("PNG_COMPRESS_LEVEL", "6"))},
+    },
+    "webp": {
+        "format": "WEBP",
+        "extension": "webp",
+        "mime": "image/webp",
+        "options": {"quality": int(config.get("WEBP_QUALITY", "85")), "method": 4},
+    },
+    "jpeg": {
+        "format": "JPEG",
+        "extension": "jpg",
+        "mime": "image/jpeg",
+        "options": {"quality": int(config.get("JPEG_QUALITY", "88")), "optimize": True, "progressive": True},
+    },
+}
+DEFAULT_FORMATS = tuple(
+    fmt.strip().lower() for fmt in config.get("OUTPUT_FORMATS", "png").split(",") if fmt.strip()
+)
+PREVIEW_WIDTH = 800
+
+PDF_PAGE_SIZE = (595.2755905511812, 841.8897637795277)  # A4 in points (reportlab.lib.pagesizes.A4)
+PDF_MARGIN = 36  # points
+PDF_MODES = ("page", "rows", "panels")
+DEFAULT_PDF_MODE = config.get("PDF_MODE", "rows")
+
+# Pillow's encoders release the GIL, so PNG, WebP, JPEG and PDF encodes really run side by side
+_executor = ThreadPoolExecutor(
+    max_workers=int(config.get("EXPORT_WORKERS", "4")), thread_name_prefix="comic-export"
+)
+
+
+def output_path(base_path, fmt):
+    """Returns base_path with the file extension of an output format."""
+    return f"{os.path.splitext(base_path)[0]}.{OUTPUT_FORMATS[fmt]['extension']}"
+
+
+def _prepare(image, fmt, options):
+    if fmt not in OUTPUT_FORMATS:
+        raise ValueError(f"Invalid output format! Choose from: {', '.join(OUTPUT_FORMATS.keys())}.")
+    spec = OUTPUT_FORMATS[fmt]
+    save_options = dict(spec["options"])
+    save_options.update(options)
+    if spec["format"] == "JPEG" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    return image, spec["format"], save_options
+
+
+def save_image(image, path, fmt="png", **options):
+    """Saves an image in one of OUTPUT_FORMATS and returns its path."""
+    image, pil_format, save_options = _prepare(image, fmt, options)
+    with metrics.timer("encode", format=fmt):
+        image.save(path, pil_format, **save_options)
+    metrics.observe_bytes(f"output_{fmt}", os.path.getsize(path))
+    return path
+
+
+def encode_image(image, fmt="png", **options):
+    """Encodes an image in one of OUTPUT_FORMATS and returns the bytes."""
+    image, pil_format, save_options = _prepare(image, fmt, options)
+    buffer = io.BytesIO()
+    image.save(buffer, pil_format, **save_options)
+    return buffer.getvalue()
+
+
+def make_preview(image, max_width=PREVIEW_WIDTH):
+    """Returns a downscaled copy of the image for on-screen display."""
+    if image.width <= max_width:
+        return image
+    size = (max_width, max(1, round(image.height * max_width / image.width)))
+    # reducing_gap lets Pillow do a cheap integer reduce() before the final resample
+    return image.resize(size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+
+
+def save_preview(image, path, max_width=PREVIEW_WIDTH):
+    """Saves an optimized JPEG preview of the image and returns its path."""
+    return save_image(make_preview(image, max_width), path, "jpeg")
+
+
+@lru_cache(maxsize=None)
+def _reportlab_canvas():
+    # reportlab is only imported once a PDF is actually built, to keep startup fast
+    from reportlab import rl_config
+    from reportlab.pdfgen import canvas
+
+    # Embed image streams as plain Flate/DCT data; the ASCII85 wrapper only adds 25% to the file
+    rl_config.useA85 = 0
+    return canvas
+
+
+def pdf_pages(comic, comic_layout=None, mode=DEFAULT_PDF_MODE):
+    """
+    Yields the images that make up the pages of a comic's PDF:
+    "page" puts the whole comic on one page, "rows" one row of the layout per page
+    and "panels" one panel (with its caption) per page. Without a layout, every
+    mode falls back to a single page.
+    """
+    if mode not in PDF_MODES:
+        raise ValueError(f"Invalid PDF mode! Choose from: {', '.join(PDF_MODES)}.")
+    if mode == "page" or comic_layout is None:
+        yield comic
+        return
+
+    cells = comic_layout["cells"]
+    if mode == "panels":
+        for cell in cells:
+            left, top = cell["image_box"][:2]
+            right, bottom = cell["caption_box"][2:]
+            yield comic.crop((left, top, right, bottom))
+        return
+
+    for row_start in range(0, len(cells), comic_layout["columns"]):
+        row = cells[row_start:row_start + comic_layout["columns"]]
+        left = min(cell["image_box"][0] for cell in row)
+        right = max(cell["caption_box"][2] for cell in row)
+        yield comic.crop((left, row[0]["image_box"][1], right, row[0]["caption_box"][3]))
+
+
+def _image_reader(image, image_format="flate", jpeg_quality=None):
+    from reportlab.lib.utils import ImageReader
+
+    if isinstance(image, (bytes, bytearray)):
+        return ImageReader(io.BytesIO(image))
+    if image_format == "jpeg":
+        quality = jpeg_quality or OUTPUT_FORMATS["jpeg"]["options"]["quality"]
+        return ImageReader(io.BytesIO(encode_image(image, "jpeg", quality=quality, progressive=False)))
+    return ImageReader(image)
+
+
+def draw_pdf_page(pdf, image, page_size=PDF_PAGE_SIZE, margin=PDF_MARGIN, image_format="flate", jpeg_quality=None):
+    """
+    Draws one image as a page, scaled to fit inside the margins with its aspect ratio kept.
+    With image_format="flate" the pixels are Flate-compressed straight into the PDF; with
+    "jpeg" the page is JPEG-encoded once and the JPEG stream is embedded as-is.
+    Encoded JPEG bytes may also be passed directly, and are embedded without re-encoding.
+    """
+    reader = _image_reader(image, image_format, jpeg_quality)
+    image_width, image_height = reader.getSize()
+    page_width, page_height = page_size
+    scale = min((page_width - 2 * margin) / image_width, (page_height - 2 * margin) / image_height)
+    width, height = image_width * scale, image_height * scale
+
+    pdf.setPageSize(page_size)
+    pdf.drawImage(reader, (page_width - width) / 2, (page_height - height) / 2, width=width, height=height)
+    pdf.showPage()
+
+
+def build_book(comics, pdf_output_path, mode=DEFAULT_PDF_MODE, page_size=PDF_PAGE_SIZE, image_format="flate", title=None):
+    """
+    Builds one PDF out of many comics. `comics` is an iterable of (comic, layout)
+    pairs, where comic is a PIL image or a path and layout may be None; it is consumed
+    one comic at a time, so a book never holds more than one comic in memory.
+    """
+    canvas = _reportlab_canvas()
+    with metrics.timer("pdf", mode=mode, image_format=image_format) as log_fields:
+        pdf = canvas.Canvas(pdf_output_path, pagesize=page_size)
+        if title:
+            pdf.setTitle(title)
+        for comic, comic_layout in comics:
+            if not isinstance(comic, Image.Image):
+                comic = Image.open(comic)
+            for page in pdf_pages(comic, comic_layout, mode):
+                draw_pdf_page(pdf, page, page_size, image_format=image_format)
+        pdf.save()
+        log_fields["pages"] = pdf.getPageNumber() - 1
+    metrics.observe_bytes("output_pdf", os.path.getsize(pdf_output_path))
+    return pdf_output_path
+
+
+def create_pdf(comic, pdf_output_path, comic_layout=None, mode=DEFAULT_PDF_MODE, image_format="flate"):
+    """Generate a PDF from the final comic strip, one layout row per page by default"""
+    return build_book([(comic, comic_layout)], pdf_output_path, mode=mode, image_format=image_format)
+
+
+class BandPDFWriter:
+    """
+    Builds the PDF of create_pdf from a comic's rows as they are rendered, top to bottom
+    (see process_comic.write_vertical_strip), so the full-size comic is never needed.
+    write_band() takes one layout row at a time; close() saves the PDF and returns its path.
+    """
+
+    def __init__(self, path, comic_layout, mode=DEFAULT_PDF_MODE, page_size=PDF_PAGE_SIZE, margin=PDF_MARGIN, image_format="flate"):
+        if mode not in PDF_MODES:
+            raise ValueError(f"Invalid PDF mode! Choose from: {', '.join(PDF_MODES)}.")
+        self.path = path
+        self.layout = comic_layout
+        self.mode = mode
+        self.page_size = page_size
+        self.image_format = image_format
+        self.row_start = 0
+        self.seconds = 0.0
+        self.pdf = _reportlab_canvas().Canvas(path, pagesize=page_size)
+
+        if mode == "page":
+            # The rows are stacked on a single page, each embedded as its own image
+            image_width, image_height = comic_layout["canvas_size"]
+            page_width, page_height = page_size
+            self.scale = min((page_width - 2 * margin) / image_width, (page_height - 2 * margin) / image_height)
+            self.left = (page_width - image_width * self.scale) / 2
+            self.top = (page_height + image_height * self.scale) / 2
+            self.pdf.setPageSize(page_size)
+
+    def write_band(self, band):
+        start = time.perf_counter()
+        row = self.layout["cells"][self.row_start:self.row_start + self.layout["columns"]]
+        self.row_start += self.layout["columns"]
+        if self.mode == "page":
+            band_height = band.height * self.scale
+            self.top -= band_height
+            self.pdf.drawImage(
+                _image_reader(band, self.image_format), self.left, self.top,
+                width=band.width * self.scale, height=band_height
+            )
+        elif self.mode == "panels":
+            for cell in row:
+                page = band.crop((cell["image_box"][0], 0, cell["caption_box"][2], band.height))
+                draw_pdf_page(self.pdf, page, self.page_size, image_format=self.image_format)
+        else:
+            left = min(cell["image_box"][0] for cell in row)
+            right = max(cell["caption_box"][2] for cell in row)
+            draw_pdf_page(self.pdf, band.crop((left, 0, right, band.height)), self.page_size, image_format=self.image_format)
+        self.seconds += time.perf_counter() - start
+
+    def close(self):
+        start = time.perf_counter()
+        if self.mode == "page":
+            self.pdf.showPage()
+        self.pdf.save()
+        seconds = self.seconds + time.perf_counter() - start
+        metrics.observe("comic_stage_seconds", seconds, stage="pdf", status="ok", mode=self.mode, image_format=self.image_format)
+        metrics.log_event(
+            "stage", stage="pdf", status="ok", mode=self.mode, image_format=self.image_format,
+            pages=self.pdf.getPageNumber() - 1, seconds=seconds
+        )
+        metrics.observe_bytes("output_pdf", os.path.getsize(self.path))
+        return self.path
+
+
+class BandPreviewWriter:
+    """
+    Builds the preview of save_preview from a comic's rows as they are rendered: each
+    row is shrunk on its own into the small preview canvas. close() saves it and returns its path.
+    """
+
+    def __init__(self, path, size, max_width=PREVIEW_WIDTH):
+        self.path = path
+        width, height = size
+        self.scale = min(1.0, max_width / width)
+        self.preview = Image.new("RGB", (max(1, round(width * self.scale)), max(1, round(height * self.scale))), "white")
+        self.top = 0
+
+    def write_band(self, band):
+        bottom = self.top + band.height
+        # Rounding the row edges rather than the row heights keeps the rows from drifting
+        box_top, box_bottom = round(self.top * self.scale), round(bottom * self.scale)
+        if box_bottom > box_top:
+            row = band.resize((self.preview.width, box_bottom - box_top), Image.Resampling.LANCZOS, reducing_gap=2.0)
+            self.preview.paste(row, (0, box_top))
+        self.top = bottom
+
+    def close(self):
+        return save_image(self.preview, self.path, "jpeg")
+
+
+def band_writers(comic_layout, pdf_path=None, preview_path=None):
+    """
+    Returns {name: writer} for the PDF and preview of a comic that is rendered row by
+    row, to be fed by process_comic.write_vertical_strip and closed by export_comic.
+    """
+    writers = {}
+    if pdf_path:
+        writers["pdf"] = BandPDFWriter(pdf_path, comic_layout)
+    if preview_path:
+        writers["preview"] = BandPreviewWriter(preview_path, comic_layout["canvas_size"])
+    return writers
+
+
+def export_comic(comic, comic_path, pdf_path=None, preview_path=None, formats=None, png_written=False, comic_layout=None, band_writers=None):
+    """
+    Encodes the composed comic into every requested format, the PDF and a preview,
+    all at the same time on the export pool, and waits for them. Passing the comic's
+    layout lets the PDF put one row per page (see create_pdf).
+    The PNG goes to comic_path; other formats sit next to it with their own extension.
+    comic may be None when the PNG was already written (e.g. a streamed vertical strip).
+    `band_writers` (see band_writers()) are outputs that were already fed the comic's
+    rows while it was rendered: they are only closed here. The PNG is read back in full
+    only for outputs that still need the whole picture, such as WebP or JPEG.
+    Returns {name: path}.
+    """
+    formats = formats or DEFAULT_FORMATS
+    band_writers = band_writers or {}
+    if pdf_path and "pdf" in band_writers:
+        pdf_path = None
+    if preview_path and "preview" in band_writers:
+        preview_path = None
+    if comic is None:
+        png_written = True
+        if pdf_path or preview_path or any(fmt != "png" for fmt in formats):
+            comic = Image.open(comic_path)
+            comic.load()
+
+    outputs = {}
+    tasks = {}
+    for fmt in formats:
+        path = comic_path if fmt == "png" else output_path(comic_path, fmt)
+        if fmt == "png" and png_written:
+            outputs[fmt] = path
+            continue
+        tasks[fmt] = _executor.submit(save_image, comic, path, fmt)
+    if pdf_path:
+        tasks["pdf"] = _executor.submit(create_pdf, comic, pdf_path, comic_layout)
+    if preview_path:
+        tasks["preview"] = _executor.submit(save_preview, comic, preview_path)
+    for name, writer in band_writers.items():
+        tasks[name] = _executor.submit(writer.close)
+
+    for name, future in tasks.items():
+        outputs[name] = future.result()
+    return outputs
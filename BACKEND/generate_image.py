@@ -1,14 +1,50 @@
 import io
 import os
-import requests
-from dotenv import load_dotenv
+import queue
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
 
-load_dotenv()
-API_KEY = os.getenv("CLIPDROP_API_KEY")
-
-OUTPUT_DIR = "PANEL_IMAGES"
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+try:
+    from . import config, metrics
+    from .disk_cache import DiskCache, make_key
+    from .http_client import HTTPClient
+    from .single_flight import SingleFlight
+except ImportError:
+    import config
+    import metrics
+    from disk_cache import DiskCache, make_key
+    from http_client import HTTPClient
+    from single_flight import SingleFlight
+
+CLIPDROP_URL = config.get("CLIPDROP_URL", "https://clipdrop-api.co/text-to-image/v1")
+MAX_CONCURRENT_REQUESTS = int(config.get("CLIPDROP_MAX_CONCURRENCY", "6"))
+REQUEST_TIMEOUT = (10, 120)  # (connect, read) seconds, per attempt
+# Overall budget for one panel, retries and backoff included
+REQUEST_DEADLINE = float(config.get("CLIPDROP_DEADLINE_SECONDS", "180"))
+MAX_RETRIES = int(config.get("CLIPDROP_MAX_RETRIES", "3"))
+
+OUTPUT_DIR = "PANEL_IMAGES"  # created when the first panel is saved
+
+# Identical prompts are served from disk instead of going back to ClipDrop
+IMAGE_CACHE = DiskCache(
+    config.get("IMAGE_CACHE_DIR", os.path.join("CACHE", "images")),
+    max_bytes=int(float(config.get("IMAGE_CACHE_MAX_MB", "500")) * 1024 * 1024),
+    max_age=float(config.get("IMAGE_CACHE_MAX_AGE_HOURS", "168")) * 3600,
+    suffix=".img",
+)
+
+# One pooled client shared by every panel request: connections are reused, rate limits
+# (429 + Retry-After) and transient errors are retried within REQUEST_DEADLINE
+CLIENT = HTTPClient(
+    "ClipDrop",
+    timeout=REQUEST_TIMEOUT,
+    deadline=REQUEST_DEADLINE,
+    max_retries=MAX_RETRIES,
+    pool_size=MAX_CONCURRENT_REQUESTS,
+)
+
+# Sessions drawing the same panel at the same time share one ClipDrop call
+IN_FLIGHT = SingleFlight("clipdrop")
 
 STYLE_MAPPINGS = {
     "Manga": "High-contrast black and white sketch with sharp, clean lines, exaggerated facial expressions, and dramatic shading. No bright colors, only grayscale tones",
@@ -32,45 +68,170 @@ Generate a high-quality, visually appealing image, consisting of the following e
 
 """
 
-def generate_images(panel_data, art_style):
-    """Generates six images (one per panel) based on panel descriptions."""
-
-    if art_style not in STYLE_MAPPINGS:
-        raise ValueError(f"Invalid art style! Choose from: {', '.join(STYLE_MAPPINGS.keys())}.")
-
-    image_paths = []
-
-    # Loop through all six panels
-    for i, panel in enumerate(panel_data):
-        prompt = panel["Description"]
-        full_prompt = (
-            f"{prompt}.\n"
-            f"Art Style: {STYLE_MAPPINGS[art_style]}.\n"
-            f"{SYSTEM_INSTRUCTIONS}"
+def build_prompt(description, art_style):
+    """Builds the full ClipDrop prompt for one panel description."""
+    return (
+        f"{description}.\n"
+        f"Art Style: {STYLE_MAPPINGS[art_style]}.\n"
+        f"{SYSTEM_INSTRUCTIONS}"
+    )
+
+
+def fetch_image_bytes(full_prompt, art_style, use_cache=True):
+    """
+    Returns the encoded ClipDrop image for a prompt, from the cache when possible.
+    A caller asking for an image that is already being fetched waits for that call instead.
+    """
+    cache_key = make_key(full_prompt, art_style, CLIPDROP_URL)
+    return IN_FLIGHT.do((cache_key, use_cache), request_image_bytes, full_prompt, cache_key, use_cache)
+
+
+def request_image_bytes(full_prompt, cache_key, use_cache):
+    """Answers fetch_image_bytes from IMAGE_CACHE or with one ClipDrop request."""
+    if use_cache:
+        cached = IMAGE_CACHE.get(cache_key)
+        metrics.cache_result("images", cached is not None)
+        if cached is not None:
+            return cached
+
+    with metrics.timer("image_request", log=False, service="clipdrop"):
+        response = CLIENT.post(
+            CLIPDROP_URL,
+            headers={"x-api-key": config.require("CLIPDROP_API_KEY")},
+            files={"prompt": (None, full_prompt)},
         )
-
-        response = requests.post(
-            "https://clipdrop-api.co/text-to-image/v1",
-            headers={"x-api-key": API_KEY},
-            files={"prompt": (None, full_prompt)}
-        )
-
-        if response.status_code == 200:
-            try:
-                image = Image.open(io.BytesIO(response.content))
-                image_path = os.path.join(OUTPUT_DIR, f"panel_{i+1}.png")
-                image.save(image_path)
-                image_paths.append(image_path)
-                print(f"Image {i+1} saved at: {image_path}")
-            
-            except Exception as e:
-                print(f"Error opening image {i+1}: {e}")
-
+        if response.status_code != 200:
+            raise Exception(f"ClipDrop API error: {response.status_code} {response.text}")
+    metrics.observe_bytes("clipdrop_image", len(response.content))
+
+    # Only cache payloads that actually decode as an image
+    Image.open(io.BytesIO(response.content)).verify()
+    IMAGE_CACHE.put(cache_key, response.content)
+    return response.content
+
+
+def generate_panel_image(index, panel, art_style, use_cache=True, save_to_disk=True, output_dir=OUTPUT_DIR):
+    """
+    Generates the image for a single panel and decodes it in memory.
+    Returns {"Image": ..., "Path": ...}; Path is None unless save_to_disk is set. Raises on failure.
+    """
+    full_prompt = build_prompt(panel["Description"], art_style)
+    image_bytes = fetch_image_bytes(full_prompt, art_style, use_cache=use_cache)
+
+    image = Image.open(io.BytesIO(image_bytes))
+    image.load()
+
+    image_path = None
+    if save_to_disk:
+        os.makedirs(output_dir, exist_ok=True)
+        image_path = os.path.join(output_dir, f"panel_{index+1}.png")
+        if image.format == "PNG":
+            # ClipDrop already sends PNG, so write the payload as-is instead of re-encoding
+            with open(image_path, "wb") as f:
+                f.write(image_bytes)
         else:
-            print(f"Error generating image for panel {i+1}: {response.text}")
+            image.save(image_path)
 
-    return image_paths
+    return {"Image": image, "Path": image_path}
 
 
+def iter_panel_results(panel_data, art_style, max_workers=MAX_CONCURRENT_REQUESTS, use_cache=True, save_to_disk=True, output_dir=OUTPUT_DIR):
+    """
+    Generates all panel images with up to `max_workers` requests in flight.
+    Yields (index, {"Image": ..., "Path": ..., "Error": ...}) as each panel finishes, in completion order.
+    panel_data may be any iterable, e.g. generate_panels.iter_panels, in which case each
+    panel's image request starts as soon as its description arrives.
+    Saved panels go to output_dir, normally a per-job directory from artifacts.job_dir.
+    """
 
+    if art_style not in STYLE_MAPPINGS:
+        raise ValueError(f"Invalid art style! Choose from: {', '.join(STYLE_MAPPINGS.keys())}.")
 
+    completed = queue.Queue()
+    futures = {}
+
+    def collect(future):
+        i = futures[future]
+        try:
+            result = future.result()
+            result["Error"] = None
+            if result["Path"]:
+                print(f"Image {i+1} saved at: {result['Path']}")
+            else:
+                print(f"Image {i+1} generated")
+        except Exception as e:
+            result = {"Image": None, "Path": None, "Error": str(e)}
+            print(f"Error generating image for panel {i+1}: {e}")
+        return i, result
+
+    yielded = 0
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        try:
+            for i, panel in enumerate(panel_data):
+                future = executor.submit(
+                    generate_panel_image, i, panel, art_style, use_cache, save_to_disk, output_dir
+                )
+                futures[future] = i
+                future.add_done_callback(completed.put)
+
+                # Hand back panels that finished while we waited for the next description
+                while not completed.empty():
+                    yield collect(completed.get())
+                    yielded += 1
+
+            while yielded < len(futures):
+                yield collect(completed.get())
+                yielded += 1
+        finally:
+            # If the caller stops iterating early, don't start panels nobody will read
+            for future in futures:
+                future.cancel()
+
+
+def generate_panel_results(panel_data, art_style, max_workers=MAX_CONCURRENT_REQUESTS, use_cache=True, save_to_disk=True, output_dir=OUTPUT_DIR):
+    """
+    Generates all panel images concurrently and waits for every one of them.
+    Returns one {"Image": ..., "Path": ..., "Error": ...} dictionary per panel, in panel order.
+    """
+    results = [None] * len(panel_data)
+    for i, result in iter_panel_results(
+        panel_data, art_style, max_workers=max_workers, use_cache=use_cache,
+        save_to_disk=save_to_disk, output_dir=output_dir
+    ):
+        results[i] = result
+    return results
+
+
+def generate_images(panel_data, art_style, max_workers=MAX_CONCURRENT_REQUESTS, use_cache=True, output_dir=OUTPUT_DIR):
+    """
+    Generates six images (one per panel) based on panel descriptions.
+    Panels are requested concurrently; pass max_workers=1 for one-at-a-time requests.
+    Set use_cache=False to always call ClipDrop, even for a prompt seen before.
+    """
+    results = generate_panel_results(
+        panel_data, art_style, max_workers=max_workers, use_cache=use_cache, output_dir=output_dir
+    )
+    return [result["Path"] for result in results if result["Path"]]
+
+
+def generate_panel_images(panel_data, art_style, max_workers=MAX_CONCURRENT_REQUESTS, use_cache=True, save_to_disk=False, output_dir=OUTPUT_DIR):
+    """
+    Same as generate_images, but returns the decoded PIL images so they can go
+    straight to process_comic without a PNG round-trip through PANEL_IMAGES.
+    """
+    results = generate_panel_results(
+        panel_data, art_style, max_workers=max_workers, use_cache=use_cache,
+        save_to_disk=save_to_disk, output_dir=output_dir
+    )
+    return [result["Image"] for result in results if result["Image"] is not None]
+
+
+def iter_images(panel_data, art_style, max_workers=MAX_CONCURRENT_REQUESTS, use_cache=True):
+    """
+    Generator mode of generate_images: yields (index, image) as soon as each panel is ready.
+    image is None for a panel that failed, so callers still learn it has finished.
+    """
+    for i, result in iter_panel_results(
+        panel_data, art_style, max_workers=max_workers, use_cache=use_cache, save_to_disk=False
+    ):
+        yield i, result["Image"]
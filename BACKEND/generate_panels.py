@@ -1,19 +1,63 @@
+import json
 import os
 import re
-from dotenv import load_dotenv
-import os
-import re
-import requests
-from dotenv import load_dotenv
+import time
+
+try:
+    from . import config, metrics
+    from .disk_cache import DiskCache, make_key
+    from .http_client import HTTPClient
+    from .schema import SchemaError, compile_schema
+    from .single_flight import SingleFlight
+except ImportError:
+    import config
+    import metrics
+    from disk_cache import DiskCache, make_key
+    from http_client import HTTPClient
+    from schema import SchemaError, compile_schema
+    from single_flight import SingleFlight
 
-load_dotenv()
+OPENROUTER_MODEL = "mistralai/mistral-7b-instruct:free"  # Public/free model on OpenRouter
+OPENROUTER_URL = config.get("OPENROUTER_URL", "https://openrouter.ai/api/v1/chat/completions")
+DEFAULT_TEMPERATURE = 0.7
+PANEL_COUNT = 6
 
-OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
-if not OPENROUTER_API_KEY:
-    raise ValueError("OPENROUTER_API_KEY environment variable is not set. Please set it in your .env file.")
+# "json" asks for a schema-constrained JSON script (response_format); "markdown" for the
+# older "# Panel N" text format, for models that don't support structured output
+RESPONSE_FORMAT = config.get("OPENROUTER_RESPONSE_FORMAT", "json").lower()
+# How many times a script with missing or invalid panels is followed up, asking for just those
+MAX_REASKS = int(config.get("OPENROUTER_MAX_REASKS", "1"))
+# A panel's description and dialogue fit well within this many tokens; max_tokens is
+# sized from it rather than left at a generous flat 1024
+TOKENS_PER_PANEL = 120
 
-OPENROUTER_MODEL = "mistralai/mistral-7b-instruct:free"  # Public/free model on OpenRouter
-OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+
+def panel_token_budget(count):
+    """max_tokens for a completion that writes `count` panels."""
+    return 32 + TOKENS_PER_PANEL * count
+
+
+DEFAULT_MAX_TOKENS = panel_token_budget(PANEL_COUNT)
+
+# The read timeout also bounds the gap between two streamed chunks
+CLIENT = HTTPClient(
+    "OpenRouter",
+    timeout=(10, 60),
+    deadline=float(config.get("OPENROUTER_DEADLINE_SECONDS", "120")),
+    max_retries=int(config.get("OPENROUTER_MAX_RETRIES", "3")),
+)
+
+# Completed panel scripts are memoized so a repeated scenario skips the LLM call
+PANEL_CACHE = DiskCache(
+    config.get("PANEL_CACHE_DIR", os.path.join("CACHE", "panels")),
+    max_bytes=int(float(config.get("PANEL_CACHE_MAX_MB", "50")) * 1024 * 1024),
+    max_age=float(config.get("PANEL_CACHE_TTL_HOURS", "24")) * 3600,
+    suffix=".json",
+)
+PANEL_CACHE_ENABLED = config.get("PANEL_CACHE_DISABLED", "").lower() not in ("1", "true", "yes")
+
+# Sessions asking for the same script at the same time share one LLM call
+IN_FLIGHT = SingleFlight("openrouter")
 
 
 TEMPLATE = """
@@ -44,15 +88,116 @@ Short Scenario:
 {scenario}
 """
 
-def generate_panels(scenario, art_style):
+JSON_TEMPLATE = """
+You are a professional comic book creator.
+
+You will be given a short scenario, and you must split it into exactly 6 comic panels.
+
+**Art Style:** {art_style}
+
+For each comic panel, provide:
+1. "description": A detailed background and character description (comma-separated, not full sentences).
+2. "text": Exact dialogue as "[Character]: [Dialogue]", or "..." if there is no dialogue.
+
+Ensure all text is clear, meaningful, and in proper English.
+
+Answer with JSON only, in this shape:
+{{"panels": [{{"description": "...", "text": "..."}}, ...]}}
+
+Short Scenario:
+{scenario}
+"""
+
+REASK_TEMPLATE = """
+You are a professional comic book creator, splitting a short scenario into 6 comic panels.
+
+**Art Style:** {art_style}
+
+Short Scenario:
+{scenario}
+
+These panels are already written:
+{written}
+
+Write only panel(s) {missing}, in that order, each with a "description" (background and
+character details, comma-separated) and a "text" (dialogue as "[Character]: [Dialogue]", or "...").
+
+Answer with JSON only, in this shape:
+{{"panels": [{{"description": "...", "text": "..."}}]}}
+"""
+
+PANEL_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "description": {"type": "string", "minLength": 1},
+        "text": {"type": "string"},
+    },
+    "required": ["description", "text"],
+    "additionalProperties": False,
+}
+validate_panel = compile_schema(PANEL_SCHEMA)
+
+PANEL_HEADER = re.compile(r"# Panel \d+")
+# A panel block ends where the next panel header, or the closing "# end" line, starts
+PANEL_BOUNDARY = re.compile(r"# Panel \d+|^# end\b", re.MULTILINE)
+# Where the panel array of a JSON script starts, and what may separate its items
+PANELS_ARRAY = re.compile(r'"panels"\s*:\s*\[')
+ARRAY_GAP = re.compile(r"[\s,]*")
+JSON_DECODER = json.JSONDecoder()
+
+
+def script_schema(count):
+    """The response_format schema of a script of exactly `count` panels."""
+    return {
+        "type": "object",
+        "properties": {
+            "panels": {"type": "array", "minItems": count, "maxItems": count, "items": PANEL_SCHEMA},
+        },
+        "required": ["panels"],
+        "additionalProperties": False,
+    }
+
+
+def normalize_scenario(scenario):
+    """Collapses runs of whitespace, so scenarios that only differ in spacing are the same request."""
+    return " ".join(scenario.split())
+
+
+def build_prompt(scenario, art_style):
+    """Fills in the script prompt for RESPONSE_FORMAT."""
+    template = JSON_TEMPLATE if RESPONSE_FORMAT == "json" else TEMPLATE
+    return template.format(scenario=normalize_scenario(scenario), art_style=art_style)
+
+
+def get_cached_script(cache_key):
+    """Returns the cached {"raw": ..., "panels": ...} entry for a prompt, or None."""
+    if not PANEL_CACHE_ENABLED:
+        return None
+    cached = PANEL_CACHE.get(cache_key)
+    metrics.cache_result("panels", cached is not None)
+    if cached is None:
+        return None
+    try:
+        return json.loads(cached)
+    except ValueError:
+        return None
+
+
+def store_script(cache_key, raw_content, panels):
+    """Stores the raw completion and its parsed panels, if the script is complete."""
+    if not PANEL_CACHE_ENABLED or len(panels) != PANEL_COUNT:
+        return
+    entry = {"raw": raw_content, "panels": panels}
+    PANEL_CACHE.put(cache_key, json.dumps(entry).encode("utf-8"))
+
+
+def build_request(formatted_prompt, temperature, max_tokens, stream=False, schema=None):
     """
-    Generates six structured comic panels based on the given scenario and art style.
-    Returns a list of dictionaries containing descriptions and dialogues.
+    Returns the headers and JSON payload for an OpenRouter chat completion.
+    With a schema (and RESPONSE_FORMAT "json"), the completion is constrained to match it.
     """
-    formatted_prompt = TEMPLATE.format(scenario=scenario, art_style=art_style)
-
     headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
+        "Authorization": f"Bearer {config.require('OPENROUTER_API_KEY')}",
         "Content-Type": "application/json"
     }
     payload = {
@@ -60,45 +205,394 @@ def generate_panels(scenario, art_style):
         "messages": [
             {"role": "user", "content": formatted_prompt}
         ],
-        "max_tokens": 1024,
-        "temperature": 0.7
+        "max_tokens": max_tokens,
+        "temperature": temperature
     }
-    response = requests.post(OPENROUTER_URL, headers=headers, json=payload)
-    if response.status_code != 200:
-        raise Exception(f"OpenRouter API error: {response.status_code} {response.text}")
+    if stream:
+        payload["stream"] = True
+    if schema is not None and RESPONSE_FORMAT == "json":
+        payload["response_format"] = {
+            "type": "json_schema",
+            "json_schema": {"name": "comic_panels", "strict": True, "schema": schema},
+        }
+    return headers, payload
+
+
+def request_completion(formatted_prompt, temperature, max_tokens, schema=None, mode="complete"):
+    """Runs one non-streamed OpenRouter completion and returns its text."""
+    headers, payload = build_request(formatted_prompt, temperature, max_tokens, schema=schema)
+    with metrics.timer("llm_request", service="openrouter", mode=mode):
+        response = CLIENT.post(OPENROUTER_URL, headers=headers, json=payload)
+        if response.status_code != 200:
+            raise Exception(f"OpenRouter API error: {response.status_code} {response.text}")
+    metrics.observe_bytes("openrouter_response", len(response.content))
     result = response.json()
-    result_content = result["choices"][0]["message"]["content"].strip()
-    return extract_panel_info(result_content)
+    return (result["choices"][0]["message"]["content"] or "").strip()
 
-def extract_panel_info(text):
+
+def generate_panels(scenario, art_style, use_cache=True, temperature=DEFAULT_TEMPERATURE, max_tokens=DEFAULT_MAX_TOKENS):
+    """
+    Generates six structured comic panels based on the given scenario and art style.
+    Returns a list of dictionaries containing descriptions and dialogues.
+    Repeated prompts are answered from PANEL_CACHE; set use_cache=False to force a fresh completion.
+    Panels missing from the model's answer are asked for again (see complete_missing_panels).
+    A caller asking for a script that is already being generated waits for that call instead.
+    """
+    formatted_prompt = build_prompt(scenario, art_style)
+    cache_key = make_key(formatted_prompt, OPENROUTER_MODEL, temperature, max_tokens)
+    panels = IN_FLIGHT.do(
+        (cache_key, use_cache), request_panels,
+        scenario, art_style, formatted_prompt, cache_key, use_cache, temperature, max_tokens
+    )
+    # Callers sharing a call get the same result, so each gets its own panel dictionaries
+    return [dict(panel) for panel in panels]
+
+
+def request_panels(scenario, art_style, formatted_prompt, cache_key, use_cache, temperature, max_tokens):
+    """Answers generate_panels from PANEL_CACHE or with one OpenRouter completion (plus any re-asks)."""
+    if use_cache:
+        cached = get_cached_script(cache_key)
+        if cached is not None:
+            return cached["panels"]
+
+    result_content = request_completion(formatted_prompt, temperature, max_tokens, script_schema(PANEL_COUNT))
+    parser = new_parser()
+    slots = fill_slots(parser.feed(result_content) + parser.close())
+    complete_missing_panels(scenario, art_style, slots, temperature)
+    panels = [panel for panel in slots if panel is not None]
+    if len(panels) != PANEL_COUNT:
+        print(f"Warning: Expected {PANEL_COUNT} panels, but got {len(panels)}.")
+    store_script(cache_key, result_content, panels)
+    return panels
+
+
+def iter_stream_content(response):
+    """Yields the content deltas of a streamed (server-sent events) OpenRouter completion."""
+    response.encoding = "utf-8"
+    for line in response.iter_lines(decode_unicode=True):
+        # Blank lines separate events; lines starting with ":" are keep-alive comments
+        if not line or line.startswith(":") or not line.startswith("data:"):
+            continue
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            break
+        chunk = json.loads(data)
+        if "error" in chunk:
+            raise Exception(f"OpenRouter API error: {chunk['error']}")
+        delta = chunk["choices"][0].get("delta", {}).get("content")
+        if delta:
+            yield delta
+
+
+def iter_panels(scenario, art_style, use_cache=True, temperature=DEFAULT_TEMPERATURE, max_tokens=DEFAULT_MAX_TOKENS):
+    """
+    Streaming mode of generate_panels: yields each panel dictionary as soon as the
+    model has finished writing it, while the later panels are still being generated.
+    A panel is finished once its JSON object is closed (or, in the markdown format,
+    once the next "# Panel N" header or the closing "# end" arrives). Panels are always
+    yielded in order, so a panel after a missing one waits for its re-ask.
+    Callers asking for a script that is already streaming follow that stream instead.
+    """
+    formatted_prompt = build_prompt(scenario, art_style)
+    cache_key = make_key(formatted_prompt, OPENROUTER_MODEL, temperature, max_tokens)
+    for panel in IN_FLIGHT.stream(
+        (cache_key, use_cache), stream_panels,
+        scenario, art_style, formatted_prompt, cache_key, use_cache, temperature, max_tokens
+    ):
+        yield dict(panel)
+
+
+def stream_panels(scenario, art_style, formatted_prompt, cache_key, use_cache, temperature, max_tokens):
+    """Answers iter_panels from PANEL_CACHE or by streaming one OpenRouter completion (plus any re-asks)."""
+    if use_cache:
+        cached = get_cached_script(cache_key)
+        if cached is not None:
+            yield from cached["panels"]
+            return
+
+    headers, payload = build_request(
+        formatted_prompt, temperature, max_tokens, stream=True, schema=script_schema(PANEL_COUNT)
+    )
+    parser = new_parser()
+    panels = []  # in script order; None for a panel that didn't validate
+    yielded = 0
+    with metrics.timer("llm_request", service="openrouter", mode="stream") as log_fields:
+        start = time.perf_counter()
+        response = CLIENT.post(OPENROUTER_URL, headers=headers, json=payload, stream=True)
+        if response.status_code != 200:
+            raise Exception(f"OpenRouter API error: {response.status_code} {response.text}")
+
+        raw_content = ""
+        try:
+            for delta in iter_stream_content(response):
+                if not raw_content:
+                    log_fields["first_token_seconds"] = time.perf_counter() - start
+                raw_content += delta
+                panels.extend(parser.feed(delta))
+                while yielded < min(len(panels), PANEL_COUNT) and panels[yielded] is not None:
+                    yield panels[yielded]
+                    yielded += 1
+                if parser.ended:
+                    break
+        finally:
+            response.close()
+        panels.extend(parser.close())
+        log_fields["response_chars"] = len(raw_content)
+
+    metrics.observe_bytes("openrouter_response", len(raw_content.encode("utf-8")))
+    slots = fill_slots(panels)
+    complete_missing_panels(scenario, art_style, slots, temperature)
+    while yielded < PANEL_COUNT and slots[yielded] is not None:
+        yield slots[yielded]
+        yielded += 1
+
+    if yielded != PANEL_COUNT:
+        print(f"Warning: Expected {PANEL_COUNT} panels, but got {yielded}.")
+    store_script(cache_key, raw_content.strip(), slots[:yielded])
+
+
+def fill_slots(panels):
+    """Pads or cuts parsed panels to exactly PANEL_COUNT slots; None marks a missing panel."""
+    return (list(panels) + [None] * PANEL_COUNT)[:PANEL_COUNT]
+
+
+def complete_missing_panels(scenario, art_style, slots, temperature=DEFAULT_TEMPERATURE):
+    """
+    Fills the None slots of a script in place by asking the model for just those panels,
+    with the panels already written as context, up to MAX_REASKS times. Each re-ask is a
+    small completion, budgeted for the missing panels only. Re-ask errors are printed,
+    not raised: the caller still has the panels it got.
     """
-    Extracts structured panel descriptions and dialogues from the generated text.
+    for _ in range(MAX_REASKS):
+        missing = [i for i, panel in enumerate(slots) if panel is None]
+        if not missing:
+            return
+        written = "\n".join(
+            f"Panel {i + 1}: {json.dumps({'description': panel['Description'], 'text': panel['Text']})}"
+            for i, panel in enumerate(slots) if panel is not None
+        ) or "(none)"
+        formatted_prompt = REASK_TEMPLATE.format(
+            art_style=art_style, scenario=normalize_scenario(scenario), written=written,
+            missing=", ".join(str(i + 1) for i in missing)
+        )
+        metrics.count("comic_llm_reasks_total", panels=len(missing))
+        try:
+            content = request_completion(
+                formatted_prompt, temperature, panel_token_budget(len(missing)), script_schema(len(missing)), mode="reask"
+            )
+        except Exception as e:
+            print(f"Re-asking for panels {[i + 1 for i in missing]} failed: {e}")
+            return
+        parser = JSONPanelParser()
+        for i, panel in zip(missing, parser.feed(content) + parser.close()):
+            slots[i] = panel
+
+
+class JSONPanelParser:
+    """
+    Incremental, single-pass parser for a {"panels": [...]} script. feed() takes the
+    text as it arrives and returns each panel as soon as its JSON object is closed:
+    every object is decoded once and checked against PANEL_SCHEMA by the compiled
+    validator, never re-parsing panels already returned. A panel that isn't valid JSON
+    or fails validation comes back as None, so later panels keep their place.
+
+    Models that ignore response_format may answer in the "# Panel N" format instead:
+    if a panel header shows up before any "panels" array, the rest of the answer is
+    handed to a MarkdownPanelParser.
     """
-    panel_info_list = []
-    panel_blocks = re.split(r"# Panel \d+", text)
 
-    for block in panel_blocks:
-        if block.strip():
-            panel_info = {}
-            desc_match = re.search(r"Description:\s*(.+)", block, re.IGNORECASE)
-            if desc_match:
-                panel_info['Description'] = desc_match.group(1).strip()
+    def __init__(self):
+        self.buffer = ""
+        self.started = False
+        self.ended = False
+        self.fallback = None
+
+    def feed(self, text):
+        if self.fallback is not None:
+            panels = self.fallback.feed(text)
+            self.ended = self.fallback.ended
+            return panels
+
+        self.buffer += text
+        panels = []
+        if not self.started:
+            # Skips any preamble or code fence the model puts before the object
+            match = PANELS_ARRAY.search(self.buffer)
+            if match is None:
+                if PANEL_HEADER.search(self.buffer):
+                    print("Warning: The model answered in the \"# Panel N\" format instead of JSON.")
+                    self.fallback = MarkdownPanelParser()
+                    buffer, self.buffer = self.buffer, ""
+                    return self.feed(buffer)
+                return panels
+            self.buffer = self.buffer[match.end():]
+            self.started = True
+
+        while not self.ended:
+            position = ARRAY_GAP.match(self.buffer).end()
+            if position == len(self.buffer):
+                break
+            if self.buffer[position] == "]":
+                self.ended = True
+                break
+            try:
+                value, end = JSON_DECODER.raw_decode(self.buffer, position)
+            except ValueError:
+                # Either the item isn't closed yet, or it is malformed: skip a malformed
+                # item whole, so the panels after it keep their place
+                end = skip_json_item(self.buffer, position)
+                if end is None:
+                    break
+                print("Warning: Discarding a panel that isn't valid JSON.")
+                value = None
             else:
-                panel_info['Description'] = "Unknown scene, ensure proper generation."
+                if end == len(self.buffer) and not isinstance(value, (dict, list)):
+                    # A number or literal at the very end may still be growing
+                    break
+            self.buffer = self.buffer[end:]
+            panels.append(None if value is None else panel_from_json(value))
+        return panels
 
-            text_match = re.findall(r'Text:\s*"([^"]+)"', block, re.IGNORECASE | re.DOTALL)
-            
-            if text_match:
-                panel_info['Text'] = " ".join(text_match)  
-            else:
-                panel_info['Text'] = "..."  
+    def close(self):
+        """Returns nothing (a panel whose object never closed is missing), unless falling back to markdown."""
+        if self.fallback is not None:
+            return self.fallback.close()
+        return []
+
+
+def skip_json_item(text, start):
+    """
+    Returns the index just past the array item starting at text[start], without
+    decoding it: for an object or array, its matching closing bracket (brackets inside
+    strings don't count); for anything else, the next "," or "]" at the same depth.
+    Returns None if the text ends before the item does.
+    """
+    depth = 0
+    in_string = False
+    escaped = False
+    for i in range(start, len(text)):
+        char = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            depth += 1
+        elif char in "}]":
+            if depth == 0:
+                return i
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        elif char == "," and depth == 0:
+            return i
+    return None
+
+
+class MarkdownPanelParser:
+    """
+    Incremental parser for the "# Panel N" text format of TEMPLATE, with the same
+    interface as JSONPanelParser: a block without a description comes back as None.
+    """
 
-            panel_info_list.append(panel_info)
+    def __init__(self):
+        self.pending = ""
+        self.ended = False
+
+    def feed(self, text):
+        self.pending += text
+        boundaries = list(PANEL_BOUNDARY.finditer(self.pending))
+        if not boundaries:
+            return []
+        # Everything before the last boundary holds finished panel blocks
+        last = boundaries[-1]
+        finished, self.pending = self.pending[:last.start()], self.pending[last.start():]
+        self.ended = last.group(0) == "# end"
+        return [parse_panel_block(block) for block in split_finished_blocks(finished)]
+
+    def close(self):
+        blocks = split_finished_blocks(self.pending)
+        self.pending = ""
+        return [parse_panel_block(block) for block in blocks]
+
+
+def new_parser():
+    """Returns a fresh incremental parser for RESPONSE_FORMAT."""
+    return JSONPanelParser() if RESPONSE_FORMAT == "json" else MarkdownPanelParser()
+
+
+def panel_from_json(value):
+    """Turns one validated panel object into a Description/Text dictionary, or None if it is invalid."""
+    try:
+        validate_panel(value)
+    except SchemaError as e:
+        print(f"Warning: Discarding an invalid panel ({e}).")
+        return None
+    description = value["description"].strip()
+    if not description:
+        print("Warning: Discarding a panel with an empty description.")
+        return None
+    text = value["text"].strip()
+    # Some models wrap the whole line in quotes, as the markdown format asks them to
+    if len(text) >= 2 and text.startswith('"') and text.endswith('"'):
+        text = text[1:-1].strip()
+    return {"Description": description, "Text": text or "..."}
+
+
+def split_finished_blocks(text):
+    """
+    Splits streamed text into non-empty panel blocks, ignoring anything after "# end"
+    and anything before the first "# Panel N" header, such as a preamble like "Sure! Here is your comic:".
+    """
+    if text.startswith("# end"):
+        return []
+    return [block for block in PANEL_HEADER.split(text)[1:] if block.strip()]
+
+
+def parse_panel_block(block, missing_description=None):
+    """
+    Parses the text of one "# Panel N" block into a Description/Text dictionary.
+    A block without a description gets `missing_description` if one is given, and
+    otherwise comes back as None, so the panel is asked for again rather than drawn.
+    """
+    panel_info = {}
+    desc_match = re.search(r"Description:\s*(.+)", block, re.IGNORECASE)
+    if desc_match:
+        panel_info['Description'] = desc_match.group(1).strip()
+    elif missing_description is not None:
+        panel_info['Description'] = missing_description
+    else:
+        print("Warning: Discarding a panel without a description.")
+        return None
+
+    text_match = re.findall(r'Text:\s*"([^"]+)"', block, re.IGNORECASE | re.DOTALL)
+    
+    if text_match:
+        panel_info['Text'] = " ".join(text_match)  
+    else:
+        panel_info['Text'] = "..."  
+
+    return panel_info
+
+
+def extract_panel_info(text):
+    """
+    Extracts structured panel descriptions and dialogues from text in the "# Panel N" format.
+    """
+    panel_info_list = [
+        parse_panel_block(block, missing_description="Unknown scene, ensure proper generation.")
+        for block in split_finished_blocks(text)
+    ]
 
-    if len(panel_info_list) != 6:
+    if len(panel_info_list) != PANEL_COUNT:
         # Log a warning but do not raise
-        print(f"Warning: Expected 6 panels, but got {len(panel_info_list)}. Using first 6.")
-    return panel_info_list[:6]
+        print(f"Warning: Expected {PANEL_COUNT} panels, but got {len(panel_info_list)}. Using first {PANEL_COUNT}.")
+    return panel_info_list[:PANEL_COUNT]
 
 if __name__ == '__main__':
     scenario = input("Enter your short comic scenario: ")
@@ -0,0 +1,210 @@
+import email.utils
+import random
+import threading
+import time
+
+try:
+    from . import metrics
+except ImportError:
+    import metrics
+
+# Responses worth another attempt: rate limiting and transient server/gateway errors
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+# Of those, the ones that say the service itself is unhealthy and count towards the breaker
+BREAKER_STATUSES = frozenset({500, 502, 503, 504})
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of sending a request while a service's circuit breaker is open."""
+
+
+class DeadlineExceededError(Exception):
+    """Raised when a call's deadline passes before a usable response arrives."""
+
+
+class CircuitBreaker:
+    """
+    Stops calling a service after `failure_threshold` consecutive failures, for
+    `reset_timeout` seconds. After that one trial request is let through
+    ("half-open"): a success closes the breaker, a failure opens it again.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state(time.monotonic())
+
+    def _state(self, now):
+        if self.opened_at is None:
+            return "closed"
+        if now - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def before_request(self):
+        """Raises CircuitOpenError unless a request may be sent now."""
+        with self._lock:
+            state = self._state(time.monotonic())
+            if state == "closed":
+                return
+            if state == "half-open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+            retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+        raise CircuitOpenError(f"{self.name} is unavailable, not retrying for another {retry_in:.0f}s.")
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_in_flight or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+def retry_after_seconds(response):
+    """Returns the delay a Retry-After header asks for, in seconds, or None."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class HTTPClient:
+    """
+    A pooled requests.Session for one external service, with a deadline per call,
+    retries with jittered exponential backoff (or the server's Retry-After), and a
+    circuit breaker. One client is shared by every thread calling the service.
+
+    post() returns the final response, successful or not, like requests.post does;
+    it only raises when no response could be had at all (connection errors or
+    timeouts on the last attempt, the deadline passing, or an open breaker).
+    """
+
+    def __init__(self, service, timeout=(10, 60), deadline=180.0, max_retries=3, backoff_base=0.5, backoff_cap=20.0, pool_size=10, failure_threshold=5, reset_timeout=30.0):
+        self.service = service
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.breaker = CircuitBreaker(service, failure_threshold, reset_timeout)
+        self.pool_size = pool_size
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    @property
+    def session(self):
+        """The pooled session, created (and requests imported) on the first call."""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    import requests
+
+                    session = requests.Session()
+                    self._mount(session)
+                    self._session = session
+        return self._session
+
+    def _mount(self, session):
+        from requests.adapters import HTTPAdapter
+
+        # Retries are done here, where they can respect the deadline, not by urllib3
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(self.pool_size, 1), max_retries=0)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+
+    def configure(self, pool_size=None):
+        """
+        Grows the connection pool to at least pool_size connections, for callers that
+        run more requests at once than the client was created for (e.g. several jobs
+        or a batch each drawing panels in parallel). Requests beyond the pool size still
+        work, but their connections are closed afterwards instead of being reused.
+        """
+        with self._session_lock:
+            if pool_size is None or pool_size <= self.pool_size:
+                return
+            self.pool_size = pool_size
+            if self._session is not None:
+                # Requests in flight keep their connections from the old adapter
+                self._mount(self._session)
+
+    def backoff(self, attempt):
+        """Full-jitter exponential backoff: a random delay up to base * 2**attempt, capped."""
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    def post(self, url, deadline=None, **kwargs):
+        return self.request("POST", url, deadline=deadline, **kwargs)
+
+    def request(self, method, url, deadline=None, **kwargs):
+        """Sends a request, retrying transient failures until it succeeds, retries run out or the deadline passes."""
+        import requests
+
+        deadline = self.deadline if deadline is None else deadline
+        expires_at = time.monotonic() + deadline
+        connect_timeout, read_timeout = self.timeout
+
+        attempt = 0
+        while True:
+            self.breaker.before_request()
+            remaining = expires_at - time.monotonic()
+            if remaining <= 0:
+                raise DeadlineExceededError(f"{self.service} call exceeded its {deadline:.0f}s deadline.")
+
+            try:
+                response = self.session.request(
+                    method, url, timeout=(min(connect_timeout, remaining), min(read_timeout, remaining)), **kwargs
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.breaker.record_failure()
+                delay = self.backoff(attempt)
+                if attempt >= self.max_retries or time.monotonic() + delay >= expires_at:
+                    raise
+                reason = type(e).__name__
+            except Exception:
+                # Not the service's fault, but a half-open breaker must not wait for this trial forever
+                self.breaker.record_failure()
+                raise
+            else:
+                if response.status_code in BREAKER_STATUSES:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                if response.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                    return response
+
+                delay = retry_after_seconds(response)
+                if delay is None:
+                    delay = self.backoff(attempt)
+                if time.monotonic() + delay >= expires_at:
+                    # Waiting would blow the deadline; the caller gets the error response now
+                    return response
+                reason = str(response.status_code)
+                response.close()
+
+            attempt += 1
+            metrics.count("comic_http_retries_total", service=self.service, reason=reason)
+            metrics.log_event("retry", service=self.service, attempt=attempt, reason=reason, delay=round(delay, 3))
+            time.sleep(delay)
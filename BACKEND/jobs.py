@@ -0,0 +1,182 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from . import artifacts, config, generate_image, generate_panels, metrics, pipeline
+except ImportError:
+    import artifacts
+    import config
+    import generate_image
+    import generate_panels
+    import metrics
+    import pipeline
+
+MAX_WORKERS = int(config.get("JOB_WORKERS", "4"))
+MAX_PENDING_JOBS = int(config.get("JOB_QUEUE_LIMIT", "50"))
+JOB_RECORD_TTL_SECONDS = 3600
+
+# How much of the overall progress bar each stage accounts for
+STAGE_WEIGHTS = {"panels": 0.2, "images": 0.65, "compose": 0.1, "export": 0.05}
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="comic-job")
+# Every job worker draws up to CLIPDROP_MAX_CONCURRENCY panels at once, through the same clients
+generate_image.CLIENT.configure(pool_size=MAX_WORKERS * generate_image.MAX_CONCURRENT_REQUESTS)
+generate_panels.CLIENT.configure(pool_size=MAX_WORKERS)
+_jobs = {}
+_lock = threading.Lock()
+
+
+class QueueFullError(Exception):
+    """Raised when too many jobs are already waiting for a worker."""
+
+
+def _prune_finished(now):
+    expired = [
+        job_id for job_id, job in _jobs.items()
+        if job["finished_at"] and now - job["finished_at"] > JOB_RECORD_TTL_SECONDS
+    ]
+    for job_id in expired:
+        del _jobs[job_id]
+
+
+def submit_job(scenario, art_style, include_text=True, is_vertical=False):
+    """
+    Queues a comic for the worker pool and returns its job ID immediately.
+    Raises QueueFullError when MAX_PENDING_JOBS jobs are already waiting or running.
+    """
+    job_id = artifacts.new_job_id()
+    now = time.time()
+    with _lock:
+        _prune_finished(now)
+        pending = sum(1 for job in _jobs.values() if job["status"] in ("queued", "running"))
+        if pending >= MAX_PENDING_JOBS:
+            raise QueueFullError("Too many comics are being generated right now. Please try again shortly.")
+        _jobs[job_id] = {
+            "id": job_id,
+            "status": "queued",
+            "stage": None,
+            "progress": {stage: 0.0 for stage in pipeline.STAGES},
+            "panel_images": [],
+            "preview_path": None,
+            "result": None,
+            "error": None,
+            "submitted_at": now,
+            "started_at": None,
+            "finished_at": None,
+        }
+
+    _executor.submit(_run_job, job_id, scenario, art_style, include_text, is_vertical)
+    return job_id
+
+
+def _update(job_id, **fields):
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is not None:
+            job.update(fields)
+
+
+def _finish(job_id, **fields):
+    # The panel previews are only shown while a job runs; dropping them keeps a
+    # finished record (kept for JOB_RECORD_TTL_SECONDS) down to its paths and text
+    _update(job_id, panel_images=[], finished_at=time.time(), **fields)
+
+
+def submit_edit(job_id, index, text=None, description=None, regenerate=False):
+    """
+    Queues a change to one panel of a finished job (see pipeline.edit_panel). The edit
+    runs under the same job ID, so the job's status and progress can be polled as before.
+    Raises ValueError if the job is unknown or still running.
+    """
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None or job["status"] != "done":
+            raise ValueError("Only a finished comic can be edited.")
+        previous_result = job["result"]
+        job.update(
+            status="queued", stage=None, result=None, error=None, finished_at=None, preview_path=None,
+            progress={stage: 0.0 for stage in pipeline.STAGES},
+        )
+
+    _executor.submit(_run_edit, job_id, previous_result, index, text, description, regenerate)
+    return job_id
+
+
+def _callbacks(job_id):
+    def on_progress(stage, done, total):
+        with _lock:
+            job = _jobs.get(job_id)
+            if job is not None:
+                job["stage"] = stage
+                job["progress"][stage] = done / total if total else 1.0
+
+    def on_panel_image(index, preview, total):
+        with _lock:
+            job = _jobs.get(job_id)
+            if job is not None:
+                if len(job["panel_images"]) != total:
+                    job["panel_images"] = [None] * total
+                job["panel_images"][index] = preview
+
+    return on_progress, on_panel_image
+
+
+def _run_edit(job_id, previous_result, index, text, description, regenerate):
+    _update(job_id, status="running", started_at=time.time())
+    on_progress, on_panel_image = _callbacks(job_id)
+    try:
+        result = pipeline.edit_panel(
+            job_id, index, text=text, description=description, regenerate=regenerate,
+            on_progress=on_progress, on_panel_image=on_panel_image
+        )
+        _finish(job_id, status="done", result=result)
+    except Exception as e:
+        # The old comic stays valid (the panel and script are saved last), so keep showing it
+        print(f"Editing panel {index + 1} of job {job_id} failed: {e}")
+        _finish(job_id, status="done", result=previous_result, error=str(e))
+    finally:
+        metrics.write_textfile()
+
+
+def _run_job(job_id, scenario, art_style, include_text, is_vertical):
+    _update(job_id, status="running", started_at=time.time())
+    on_progress, on_panel_image = _callbacks(job_id)
+
+    def on_preview(path):
+        _update(job_id, preview_path=path)
+
+    try:
+        result = pipeline.run_comic(
+            scenario, art_style, job_id=job_id,
+            include_text=include_text, is_vertical=is_vertical,
+            on_progress=on_progress, on_panel_image=on_panel_image, on_preview=on_preview
+        )
+        _finish(job_id, status="done", result=result)
+    except Exception as e:
+        print(f"Job {job_id} failed: {e}")
+        _finish(job_id, status="failed", error=str(e))
+    finally:
+        metrics.write_textfile()
+
+
+def get_job(job_id):
+    """
+    Returns a snapshot of a job's status, or None for an unknown job.
+    The snapshot includes an overall "percent" (0-1) for progress bars and
+    "panel_images", the previews of the panels finished so far (None for the rest; empty
+    once the job has finished), and
+    "preview_path", a small preview of the whole comic once it exists (None until then).
+    """
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return None
+        snapshot = dict(job)
+        snapshot["progress"] = dict(job["progress"])
+        snapshot["panel_images"] = list(job["panel_images"])
+
+    snapshot["percent"] = sum(
+        STAGE_WEIGHTS.get(stage, 0.0) * done for stage, done in snapshot["progress"].items()
+    )
+    return snapshot
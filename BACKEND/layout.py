@@ -0,0 +1,58 @@
+import math
+
+# Named layout templates, as a number of columns
+TEMPLATES = {
+    "grid": 2,      # classic comic page: two panels per row
+    "wide": 3,      # three panels per row
+    "vertical": 1,  # webtoon-style strip: one panel per row
+}
+
+
+def compute_layout(panel_count, panel_size, columns=2, text_height=0):
+    """
+    Precomputes the geometry of a comic with `panel_count` panels of `panel_size`
+    (width, height), laid out `columns` panels per row with a caption box of
+    `text_height` under each panel. An incomplete last row is centred.
+
+    Returns a dictionary with the canvas size and, for each panel in order, the
+    box its image is pasted into and the box of its caption (left, top, right, bottom).
+    """
+    if panel_count < 1:
+        raise ValueError("A layout needs at least one panel.")
+    if columns < 1:
+        raise ValueError("A layout needs at least one column.")
+
+    columns = min(columns, panel_count)
+    rows = math.ceil(panel_count / columns)
+    panel_width, panel_height = panel_size
+    cell_height = panel_height + text_height
+
+    cells = []
+    for i in range(panel_count):
+        row, col = divmod(i, columns)
+        panels_in_row = min(columns, panel_count - row * columns)
+        row_offset = (columns - panels_in_row) * panel_width // 2
+
+        x = row_offset + col * panel_width
+        y = row * cell_height
+        cells.append({
+            "image_box": (x, y, x + panel_width, y + panel_height),
+            "caption_box": (x, y + panel_height, x + panel_width, y + cell_height),
+        })
+
+    return {
+        "canvas_size": (columns * panel_width, rows * cell_height),
+        "panel_size": (panel_width, panel_height),
+        "columns": columns,
+        "rows": rows,
+        "cells": cells,
+    }
+
+
+def columns_for(template):
+    """Returns the column count for a template name, or the value itself if it is already a number."""
+    if isinstance(template, int):
+        return template
+    if template not in TEMPLATES:
+        raise ValueError(f"Unknown layout template! Choose from: {', '.join(TEMPLATES.keys())}.")
+    return TEMPLATES[template]
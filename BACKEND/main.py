@@ -1,15 +1,9 @@
-import os
+import artifacts
 import generate_panels
 import generate_image
 import process_comic
 from PIL import Image
 
-PANEL_FOLDER = "PANEL_IMAGES"
-OUTPUT_FOLDER = "OUTPUT"
-
-os.makedirs(PANEL_FOLDER, exist_ok=True)
-os.makedirs(OUTPUT_FOLDER, exist_ok=True)
-
 def main():
 
     # Step 1: Enter user Story Prompt
@@ -30,8 +24,8 @@ def main():
 
     # Step 4: Generate images for panels
     print("\n Generating images for comic panels...")
-    image_paths = generate_image.generate_images(panel_data, art_style)
-    if len(image_paths) != 6:
+    panel_images = generate_image.generate_panel_images(panel_data, art_style)
+    if len(panel_images) != 6:
         print(" Failed to generate all panel images.")
         return
 
@@ -41,8 +35,8 @@ def main():
     # Step 6: Create final comic strip
     print("\n Creating the final comic strip...")
     
-    output_path = os.path.join(OUTPUT_FOLDER, "comic_strip_with_text.png")
-    process_comic.create_comic_strip_with_text(image_paths, panel_texts, output_path)
+    output_path = artifacts.job_paths(artifacts.new_job_id())["comic"]
+    process_comic.create_comic_strip_with_text(panel_images, panel_texts, output_path)
     print(f"\nComic generation complete! Check '{output_path}'")
 
 
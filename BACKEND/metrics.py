@@ -0,0 +1,230 @@
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    from . import config
+except ImportError:
+    import config
+
+# Where structured (JSON lines) logs go: "stderr", "off", or a file path
+METRICS_LOG = config.get("METRICS_LOG", "stderr")
+# If set, the Prometheus text exposition is rewritten to this file after every comic
+METRICS_FILE = config.get("METRICS_FILE")
+# If set, the Prometheus text exposition is served on this port at /metrics
+METRICS_PORT = config.get("METRICS_PORT")
+
+# Histogram bucket upper bounds, in seconds and bytes
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+BYTES_BUCKETS = (1024, 16 * 1024, 64 * 1024, 256 * 1024, 1024 ** 2, 4 * 1024 ** 2, 16 * 1024 ** 2, 64 * 1024 ** 2)
+
+HELP = {
+    "comic_stage_seconds": "Duration of each pipeline stage and external call.",
+    "comic_payload_bytes": "Size of API responses and encoded outputs.",
+    "comic_cache_requests_total": "Cache lookups by cache and result (hit or miss).",
+    "comic_http_retries_total": "HTTP requests retried after a failure, by service.",
+    "comic_llm_reasks_total": "Follow-up LLM calls for panels missing from a script, by number of panels.",
+    "comic_shared_requests_total": "Calls answered by an identical call already in flight, by service.",
+    "comic_comics_total": "Finished comics by status.",
+}
+
+_lock = threading.Lock()
+_counters = {}    # (name, labels) -> value
+_histograms = {}  # (name, labels) -> {"buckets": [...], "counts": [...], "sum": ..., "count": ...}
+_log_lock = threading.Lock()
+_server = None
+
+
+def _labels(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def count(name, value=1, **labels):
+    """Adds `value` to a counter."""
+    key = (name, _labels(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, value, buckets=SECONDS_BUCKETS, **labels):
+    """Records one observation in a histogram."""
+    key = (name, _labels(labels))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {"buckets": buckets, "counts": [0] * len(buckets), "sum": 0.0, "count": 0}
+        for i, bound in enumerate(histogram["buckets"]):
+            if value <= bound:
+                histogram["counts"][i] += 1
+        histogram["sum"] += value
+        histogram["count"] += 1
+
+
+def observe_bytes(kind, size):
+    """Records the size of a payload, e.g. an API response or an encoded file."""
+    observe("comic_payload_bytes", size, buckets=BYTES_BUCKETS, kind=kind)
+
+
+def cache_result(cache, hit):
+    """Counts one cache lookup."""
+    count("comic_cache_requests_total", cache=cache, result="hit" if hit else "miss")
+
+
+def log_event(event, **fields):
+    """Writes one structured log line (a JSON object) to METRICS_LOG."""
+    if METRICS_LOG == "off":
+        return
+    record = {"ts": round(time.time(), 3), "event": event}
+    record.update(fields)
+    line = json.dumps(record, default=str) + "\n"
+    with _log_lock:
+        if METRICS_LOG == "stderr":
+            sys.stderr.write(line)
+        else:
+            with open(METRICS_LOG, "a") as f:
+                f.write(line)
+
+
+@contextmanager
+def timer(stage, log=True, **labels):
+    """
+    Times the enclosed block as `stage` in the comic_stage_seconds histogram and,
+    unless log=False, writes a structured log line with its duration. Yields a
+    dictionary that the block may fill with extra fields for the log line;
+    "seconds" is set in it once the block exits.
+    """
+    fields = {}
+    status = "ok"
+    start = time.perf_counter()
+    try:
+        yield fields
+    except Exception:
+        # A generator closed early (GeneratorExit) is not a failure of the stage
+        status = "error"
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        fields["seconds"] = seconds
+        observe("comic_stage_seconds", seconds, stage=stage, status=status, **labels)
+        if log:
+            log_event("stage", stage=stage, status=status, **labels, **fields)
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+
+def render_prometheus():
+    """Returns every metric in the Prometheus text exposition format."""
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted(
+            (key, dict(histogram, counts=list(histogram["counts"]))) for key, histogram in _histograms.items()
+        )
+
+    lines = []
+    declared = set()
+
+    def declare(name, kind):
+        if name not in declared:
+            declared.add(name)
+            if name in HELP:
+                lines.append(f"# HELP {name} {HELP[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+    for (name, labels), value in counters:
+        declare(name, "counter")
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+    for (name, labels), histogram in histograms:
+        declare(name, "histogram")
+        for bound, bucket_count in zip(histogram["buckets"], histogram["counts"]):
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {bucket_count}")
+        lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {histogram['count']}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {histogram['sum']}")
+        lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def write_textfile(path=None):
+    """Writes the metrics to a file (METRICS_FILE by default), atomically, for a node-exporter style collector."""
+    path = path or METRICS_FILE
+    if not path:
+        return None
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(render_prometheus())
+    os.replace(tmp_path, path)
+    return path
+
+
+def start_http_server(port=None):
+    """Serves the metrics at http://0.0.0.0:<port>/metrics from a daemon thread, once per process."""
+    global _server
+    port = port or METRICS_PORT
+    if not port:
+        return None
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    with _lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer(("0.0.0.0", int(port)), Handler)
+            except OSError as e:
+                # Another process (e.g. a second Streamlit worker) already serves this port
+                print(f"Metrics endpoint not started on port {port}: {e}")
+                return None
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+    return _server
+
+
+def snapshot():
+    """Returns a picklable copy of every counter and histogram, e.g. to send back from a worker process."""
+    with _lock:
+        return {
+            "counters": dict(_counters),
+            "histograms": {key: dict(histogram, counts=list(histogram["counts"])) for key, histogram in _histograms.items()},
+        }
+
+
+def merge(data):
+    """Adds a snapshot() taken in another process to this process's metrics."""
+    with _lock:
+        for key, value in data["counters"].items():
+            _counters[key] = _counters.get(key, 0) + value
+        for key, other in data["histograms"].items():
+            histogram = _histograms.get(key)
+            if histogram is None:
+                _histograms[key] = dict(other, counts=list(other["counts"]))
+                continue
+            histogram["counts"] = [a + b for a, b in zip(histogram["counts"], other["counts"])]
+            histogram["sum"] += other["sum"]
+            histogram["count"] += other["count"]
+
+
+def reset():
+    """Clears every counter and histogram."""
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
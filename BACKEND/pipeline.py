@@ -0,0 +1,285 @@
+import time
+
+try:
+    from . import artifacts, compose_pool, export, generate_image, generate_panels, metrics, process_comic
+except ImportError:
+    import artifacts
+    import compose_pool
+    import export
+    import generate_image
+    import generate_panels
+    import metrics
+    import process_comic
+
+STAGES = ("panels", "images", "compose", "export")
+PANEL_COUNT = 6
+PANEL_PREVIEW_SIZE = 512  # longest side of the per-panel previews shown while a job runs
+
+
+def run_comic(scenario, art_style, job_id=None, include_text=True, is_vertical=False, on_progress=None, on_panel_image=None, formats=None, on_preview=None):
+    """
+    Runs the full pipeline for one comic: panel script, panel images, composition, export.
+    on_progress(stage, done, total) is called as each stage advances,
+    on_panel_image(index, preview, total) as soon as each panel image is ready, and
+    on_preview(path) once a small preview of the whole comic is saved, before the
+    full-resolution comic is composed.
+    formats picks the image formats to export (export.DEFAULT_FORMATS by default).
+    Returns a dictionary with the job ID, the panel script, the paths of every output and
+    "timings", the seconds spent in each stage. Because images are drawn while the script is
+    still streaming, "images" only counts the wait for images after the script was finished,
+    so the stages add up to "total". "preview_ready" is the time from the start until the
+    preview was saved; it is part of "compose".
+    """
+    job_id = job_id or artifacts.new_job_id()
+    paths = artifacts.job_paths(job_id)
+    try:
+        return _run_comic(scenario, art_style, job_id, paths, include_text, is_vertical, on_progress, on_panel_image, formats, on_preview)
+    except Exception as e:
+        metrics.count("comic_comics_total", status="failed")
+        metrics.log_event("comic", job_id=job_id, status="failed", error=str(e))
+        raise
+
+
+def _run_comic(scenario, art_style, job_id, paths, include_text, is_vertical, on_progress, on_panel_image, formats, on_preview):
+    started = time.perf_counter()
+    marks = {}
+
+    def report(stage, done, total):
+        if on_progress:
+            on_progress(stage, done, total)
+
+    # Steps 1 & 2: Stream the panel script and start drawing each panel as soon as its
+    # description arrives, so the image calls overlap with the rest of the LLM output
+    panel_data = []
+
+    def script_stream():
+        for panel in generate_panels.iter_panels(scenario, art_style):
+            panel_data.append(panel)
+            report("panels", len(panel_data), PANEL_COUNT)
+            yield panel
+        marks["panels"] = time.perf_counter()
+
+    report("panels", 0, PANEL_COUNT)
+    finished = {}
+    # Panels are kept in the job directory so a single one can be redrawn later (see edit_panel)
+    for index, result in generate_image.iter_panel_results(script_stream(), art_style, output_dir=paths["dir"]):
+        finished[index] = result
+        if on_panel_image and result["Image"] is not None:
+            preview = result["Image"].copy()
+            preview.thumbnail((PANEL_PREVIEW_SIZE, PANEL_PREVIEW_SIZE))
+            on_panel_image(index, preview, PANEL_COUNT)
+        report("images", len(finished), PANEL_COUNT)
+
+    marks["images"] = time.perf_counter()
+    marks.setdefault("panels", marks["images"])
+
+    if len(panel_data) != PANEL_COUNT:
+        raise Exception(f"Expected {PANEL_COUNT} panels, but the script has {len(panel_data)}.")
+    results = [finished[i] for i in range(len(panel_data))]
+    failed = [i + 1 for i, result in enumerate(results) if result["Image"] is None]
+    if failed:
+        raise Exception(f"Failed to generate all panel images (missing panels: {failed}).")
+
+    # Step 3a: A preview composed from reduced panels, so the comic can be shown
+    # long before the full-resolution strip and its exports are ready
+    report("compose", 0, 1)
+    panel_images = [result["Image"] for result in results]
+    with metrics.timer("preview"):
+        preview = process_comic.create_preview(
+            panel_images, caption_texts(panel_data, include_text), export.PREVIEW_WIDTH, is_vertical
+        )
+        export.save_preview(preview, paths["preview"])
+    preview_ready = time.perf_counter()
+    if on_preview:
+        on_preview(paths["preview"])
+
+    # Steps 3b & 4: Create the final comic strip and encode the image formats and PDF,
+    # in a worker process so the CPU work of many jobs spreads over every core
+    outputs, seconds = compose_pool.submit(
+        compose_and_export, panel_images, panel_data, paths, include_text, is_vertical, formats, False
+    ).result()
+    outputs["preview"] = paths["preview"]
+    marks["export"] = time.perf_counter()
+    marks["compose"] = marks["export"] - seconds["export"]
+    report("compose", 1, 1)
+    report("export", 1, 1)
+
+    timings = stage_timings(started, marks)
+    timings["preview_ready"] = preview_ready - started
+    metrics.count("comic_comics_total", status="done")
+    metrics.log_event("comic", job_id=job_id, status="done", **timings)
+    artifacts.write_state(job_id, {
+        "scenario": scenario,
+        "art_style": art_style,
+        "include_text": include_text,
+        "is_vertical": is_vertical,
+        "formats": formats,
+        "panels": panel_data,
+    })
+
+    return comic_result(job_id, panel_data, outputs, timings)
+
+
+def stage_timings(started, marks):
+    """Turns the perf_counter() marks taken at the end of each stage into seconds per stage, plus "total"."""
+    timings = {}
+    previous = started
+    for stage in STAGES:
+        timings[stage] = marks[stage] - previous
+        previous = marks[stage]
+    timings["total"] = previous - started
+    return timings
+
+
+def comic_result(job_id, panel_data, outputs, timings):
+    return {
+        "job_id": job_id,
+        "panels": panel_data,
+        # The composed PNG is always kept, even when it isn't one of the download formats
+        "comic_path": artifacts.job_paths(job_id)["comic"],
+        "pdf_path": outputs["pdf"],
+        "preview_path": outputs["preview"],
+        "outputs": outputs,
+        "timings": timings,
+    }
+
+
+def caption_texts(panel_data, include_text=True):
+    return [panel["Text"] for panel in panel_data] if include_text else [""] * len(panel_data)
+
+
+def compose_comic(panel_data, panel_images, paths, include_text=True, is_vertical=False, band_writers=(), slice_dir=None):
+    """
+    Lays out the panels and their captions. Vertical strips are streamed to paths["comic"]
+    band by band to keep memory flat, and None is returned; each band also goes to
+    `band_writers` on the way and, with slice_dir, is saved there as a slice for lazy
+    loading (see process_comic.write_vertical_strip). Grids stay in memory and the
+    image is returned for export_outputs to encode.
+    """
+    return process_comic.create_comic_strip_with_text(
+        panel_images, caption_texts(panel_data, include_text), paths["comic"] if is_vertical else None,
+        is_vertical, stream=is_vertical, band_writers=band_writers, slice_dir=slice_dir
+    )
+
+
+def export_outputs(comic, panel_images, paths, is_vertical=False, formats=None, preview=True, band_writers=None):
+    """
+    Encodes the image formats, PDF and (unless preview is False, when one was already
+    saved by create_preview) the preview of a composed comic into its job paths.
+    `band_writers` are the outputs compose_comic already built while streaming a strip.
+    paths["comic"] is written as a PNG whatever the formats: edit_panel redraws cells
+    of that image. The returned outputs only list the requested formats.
+    """
+    comic_layout = process_comic.comic_layout_for(panel_images, is_vertical)
+    formats = tuple(formats or export.DEFAULT_FORMATS)
+    outputs = export.export_comic(
+        comic, paths["comic"], pdf_path=paths["pdf"], preview_path=paths["preview"] if preview else None,
+        formats=formats if "png" in formats else formats + ("png",), comic_layout=comic_layout,
+        band_writers=band_writers
+    )
+    if "png" not in formats:
+        del outputs["png"]
+    return outputs
+
+
+def compose_and_export(panel_images, panel_data, paths, include_text=True, is_vertical=False, formats=None, preview=True, slices=False):
+    """
+    compose_comic and export_outputs in one call, meant for compose_pool.submit.
+    A vertical strip is rendered once: its PDF and preview are built from the same
+    bands as the streamed PNG. With slices, a vertical strip is also cut into
+    paths["slices"], returned as the "slices" output.
+    Returns the output paths and the seconds each of the two steps took.
+    """
+    started = time.perf_counter()
+    band_writers = {}
+    if is_vertical:
+        band_writers = export.band_writers(
+            process_comic.comic_layout_for(panel_images, is_vertical), paths["pdf"],
+            paths["preview"] if preview else None
+        )
+    slice_dir = paths["slices"] if slices and is_vertical else None
+    comic = compose_comic(panel_data, panel_images, paths, include_text, is_vertical, band_writers.values(), slice_dir)
+    composed = time.perf_counter()
+    outputs = export_outputs(comic, panel_images, paths, is_vertical, formats, preview, band_writers)
+    if slice_dir:
+        outputs["slices"] = slice_dir
+    return outputs, {"compose": composed - started, "export": time.perf_counter() - composed}
+
+
+def edit_panel(job_id, index, text=None, description=None, regenerate=False, on_progress=None, on_panel_image=None):
+    """
+    Changes one panel of a finished comic without rerunning the rest of the pipeline.
+    `text` replaces the panel's caption; `regenerate` draws a new image for it (from
+    `description`, if given, else the original description). Only that panel's cell of
+    the existing comic is re-rendered, then the outputs are re-encoded.
+    Takes the same callbacks as run_comic and returns a result in the same shape.
+    """
+    state = artifacts.read_state(job_id)
+    if state is None:
+        raise Exception("This comic is no longer available.")
+    panel_data = state["panels"]
+    if not 0 <= index < len(panel_data):
+        raise ValueError(f"There is no panel {index + 1} in this comic.")
+    if text is None and description is None and not regenerate:
+        raise ValueError("Nothing to change: pass a new text, a new description or regenerate=True.")
+
+    def report(stage, done, total):
+        if on_progress:
+            on_progress(stage, done, total)
+
+    started = time.perf_counter()
+    marks = {}
+    paths = artifacts.job_paths(job_id)
+    panel = dict(panel_data[index])
+    if text is not None:
+        panel["Text"] = text
+    if description is not None:
+        panel["Description"] = description
+        regenerate = True
+    report("panels", 1, 1)
+    marks["panels"] = time.perf_counter()
+
+    panel_files = [artifacts.panel_path(job_id, i) for i in range(len(panel_data))]
+    image_bytes = None
+    if regenerate:
+        report("images", 0, 1)
+        # Skip the cache: the same prompt would just return the image being replaced
+        image_bytes = generate_image.fetch_image_bytes(
+            generate_image.build_prompt(panel["Description"], state["art_style"]), state["art_style"], use_cache=False
+        )
+        image = process_comic.open_panel(image_bytes)
+        if on_panel_image:
+            preview = image.copy()
+            preview.thumbnail((PANEL_PREVIEW_SIZE, PANEL_PREVIEW_SIZE))
+            on_panel_image(index, preview, len(panel_data))
+        report("images", 1, 1)
+    else:
+        image = process_comic.open_panel(panel_files[index])
+    marks["images"] = time.perf_counter()
+
+    report("compose", 0, 1)
+    comic = process_comic.open_panel(paths["comic"])
+    comic.load()
+    comic_layout = process_comic.comic_layout_for(panel_files, state["is_vertical"])
+    with metrics.timer("compose", layout="redraw_panel"):
+        process_comic.redraw_panel(comic, comic_layout, index, image, panel["Text"] if state["include_text"] else "")
+    report("compose", 1, 1)
+    marks["compose"] = time.perf_counter()
+
+    report("export", 0, 1)
+    outputs = export_outputs(comic, panel_files, paths, state["is_vertical"], state["formats"])
+    report("export", 1, 1)
+    marks["export"] = time.perf_counter()
+
+    # The panel file and the script are only replaced once the new outputs are written
+    if image_bytes is not None:
+        with open(panel_files[index], "wb") as f:
+            f.write(image_bytes)
+    panel_data[index] = panel
+    artifacts.write_state(job_id, state)
+    artifacts.touch_job(job_id)
+
+    timings = stage_timings(started, marks)
+    metrics.log_event("panel_edit", job_id=job_id, panel=index + 1, regenerated=regenerate, **timings)
+
+    return comic_result(job_id, panel_data, outputs, timings)
@@ -0,0 +1,76 @@
+import struct
+import zlib
+
+from PIL import Image, ImageChops
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+UP_FILTER = b"\x02"
+IDAT_CHUNK_SIZE = 256 * 1024
+
+
+def _chunk(chunk_type, data):
+    return (
+        struct.pack(">I", len(data))
+        + chunk_type
+        + data
+        + struct.pack(">I", zlib.crc32(chunk_type + data) & 0xFFFFFFFF)
+    )
+
+
+class StreamingPNGWriter:
+    """
+    Writes an RGB PNG band by band, so the whole image never has to exist in memory.
+    The height must be known up front; bands of any height are appended top to bottom.
+    Rows use the PNG "Up" filter, computed in C by ImageChops.subtract_modulo.
+    """
+
+    def __init__(self, fp, width, height, compress_level=6):
+        self.fp = fp
+        self.width = width
+        self.height = height
+        self.rows_written = 0
+        self._compressor = zlib.compressobj(compress_level)
+        self._pending = b""
+        self._previous_row = Image.new("RGB", (width, 1), (0, 0, 0))
+
+        self.fp.write(PNG_SIGNATURE)
+        # 8-bit depth, colour type 2 (RGB), default compression/filter, no interlace
+        self.fp.write(_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)))
+
+    def write_band(self, band):
+        """Appends the rows of `band`, which must be as wide as the image."""
+        band = band.convert("RGB") if band.mode != "RGB" else band
+        if band.width != self.width:
+            raise ValueError(f"Band is {band.width}px wide, expected {self.width}px.")
+        if self.rows_written + band.height > self.height:
+            raise ValueError("Band would write past the bottom of the image.")
+
+        # Up filter: each byte minus the byte directly above it, modulo 256
+        above = Image.new("RGB", band.size)
+        above.paste(self._previous_row, (0, 0))
+        if band.height > 1:
+            above.paste(band.crop((0, 0, band.width, band.height - 1)), (0, 1))
+        filtered = ImageChops.subtract_modulo(band, above).tobytes()
+
+        stride = self.width * 3
+        scanlines = b"".join(
+            UP_FILTER + filtered[offset:offset + stride]
+            for offset in range(0, len(filtered), stride)
+        )
+        self._write_idat(self._compressor.compress(scanlines))
+
+        self._previous_row = band.crop((0, band.height - 1, band.width, band.height))
+        self.rows_written += band.height
+
+    def _write_idat(self, data, flush=False):
+        self._pending += data
+        while len(self._pending) >= IDAT_CHUNK_SIZE or (flush and self._pending):
+            self.fp.write(_chunk(b"IDAT", self._pending[:IDAT_CHUNK_SIZE]))
+            self._pending = self._pending[IDAT_CHUNK_SIZE:]
+
+    def close(self):
+        """Finishes the image. Every row must have been written."""
+        if self.rows_written != self.height:
+            raise ValueError(f"Only {self.rows_written} of {self.height} rows were written.")
+        self._write_idat(self._compressor.flush(), flush=True)
+        self.fp.write(_chunk(b"IEND", b""))
@@ -1,5 +1,17 @@
+import io
+import json
+import math
 import os
-from PIL import Image, ImageDraw, ImageFont
+from functools import lru_cache
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+try:
+    from . import layout, metrics
+    from .png_stream import StreamingPNGWriter
+except ImportError:
+    import layout
+    import metrics
+    from png_stream import StreamingPNGWriter
 
 DEFAULT_FONT_SIZE = 42
 TEXT_HEIGHT = 100
@@ -9,8 +21,9 @@ TEXT_BOX_BORDER = 4
 OUTLINE_THICKNESS = 2
 
 
+@lru_cache(maxsize=None)
 def load_default_font(size):
-    """Loads Arial font or falls back to PIL default."""
+    """Loads Arial font or falls back to PIL default. Cached per size for the whole process."""
     try:
         return ImageFont.truetype("arial.ttf", size)
     except OSError:
@@ -18,6 +31,15 @@ def load_default_font(size):
         return ImageFont.load_default()
 
 
+def open_panel(panel):
+    """Returns a PIL image for a panel given as an Image, encoded bytes or a file path."""
+    if isinstance(panel, Image.Image):
+        return panel
+    if isinstance(panel, (bytes, bytearray, memoryview)):
+        return Image.open(io.BytesIO(panel))
+    return Image.open(panel)
+
+
 def add_border(image, border_thickness, color="black"):
     """Adds a bold border around the image."""
     bordered_image = Image.new(
@@ -29,37 +51,106 @@ def add_border(image, border_thickness, color="black"):
     return bordered_image
 
 
+@lru_cache(maxsize=8192)
+def text_width(font, text):
+    """Returns the rendered width of a string. Cached, since captions reuse the same words."""
+    return font.getlength(text)
+
+
+@lru_cache(maxsize=None)
+def line_height(font):
+    """Returns the line height used for captions in the given font."""
+    bbox = font.getbbox("A")
+    return bbox[3] - bbox[1]
+
+
 def wrap_text(draw, text, font, max_width):
-    """Wraps text into multiple lines based on panel width."""
+    """
+    Wraps text into multiple lines based on panel width.
+    Each word is measured once (and cached); line widths are summed rather than
+    re-measuring the growing line for every word.
+    """
     lines = []
-    words = text.split()
-    current_line = ""
+    space_width = text_width(font, " ")
+    current_words = []
+    current_width = 0
 
-    for word in words:
-        test_line = f"{current_line} {word}".strip()
-        bbox = draw.textbbox((0, 0), test_line, font=font)
-        line_width = bbox[2] - bbox[0]
+    for word in text.split():
+        word_width = text_width(font, word)
+        line_width = current_width + space_width + word_width if current_words else word_width
 
-        if line_width <= max_width:
-            current_line = test_line
+        if line_width <= max_width or not current_words:
+            current_words.append(word)
+            current_width = line_width
         else:
-            lines.append(current_line)
-            current_line = word
+            lines.append(" ".join(current_words))
+            current_words = [word]
+            current_width = word_width
 
-    if current_line:
-        lines.append(current_line)
+    if current_words:
+        lines.append(" ".join(current_words))
     
     return lines
 
 
 def draw_text_with_outline(draw, position, text, font, fill_color="black", outline_color="white", outline_thickness=OUTLINE_THICKNESS):
-    """Draws text with outline for better readability."""
+    """
+    Draws text with outline for better readability.
+    FreeType fonts use Pillow's native stroke, so the text is rendered once whatever the
+    thickness; bitmap fonts get their outline from a single dilation of the text mask.
+    """
+    if outline_thickness <= 0:
+        draw.text(position, text, font=font, fill=fill_color)
+        return
+
+    if isinstance(font, ImageFont.FreeTypeFont):
+        draw.text(
+            position, text, font=font, fill=fill_color,
+            stroke_width=outline_thickness, stroke_fill=outline_color
+        )
+        return
+
+    # Bitmap fonts can't be stroked: grow the glyph mask by the thickness in every direction
     x, y = position
-    for dx in range(-outline_thickness, outline_thickness + 1):
-        for dy in range(-outline_thickness, outline_thickness + 1):
-            if dx != 0 or dy != 0:
-                draw.text((x + dx, y + dy), text, font=font, fill=outline_color)
-    draw.text((x, y), text, font=font, fill=fill_color)
+    left, top, right, bottom = draw.textbbox((0, 0), text, font=font)
+    pad = outline_thickness
+    mask = Image.new("L", (right + 2 * pad, bottom + 2 * pad), 0)
+    ImageDraw.Draw(mask).text((pad, pad), text, font=font, fill=255)
+    outline = mask.filter(ImageFilter.MaxFilter(2 * outline_thickness + 1))
+    draw.bitmap((x - pad, y - pad), outline, fill=outline_color)
+    draw.bitmap((x - pad, y - pad), mask, fill=fill_color)
+
+
+def caption_lines(text, font, width, scale=1):
+    """Returns the lines draw_caption wraps `text` into for a caption box `width` pixels wide."""
+    return wrap_text(None, text, font, width - round(20 / scale))
+
+
+def draw_caption(draw, box, text, font, scale=1, lines=None):
+    """
+    Draws a bordered caption box with wrapped, centred, outlined text into `box`.
+    scale shrinks the border, padding and outline for a comic drawn at 1/scale size.
+    `lines` are the caption_lines of the text, if the caller already wrapped it.
+    """
+    left, top, right, bottom = box
+    width = right - left
+    text_height = bottom - top
+    outline_thickness = max(1, round(OUTLINE_THICKNESS / scale))
+
+    draw.rectangle(box, outline="black", width=max(1, round(TEXT_BOX_BORDER / scale)))
+
+    if lines is None:
+        lines = caption_lines(text, font, width, scale)
+
+    caption_line_height = line_height(font)
+
+    total_text_height = len(lines) * caption_line_height
+    text_y = top + (text_height - total_text_height) // 2
+
+    for line in lines:
+        text_x = left + int(width - text_width(font, line)) // 2
+        draw_text_with_outline(draw, (text_x, text_y), line, font, outline_thickness=outline_thickness)
+        text_y += caption_line_height
 
 
 def add_text_below(image, text, font, text_height=TEXT_HEIGHT):
@@ -70,24 +161,8 @@ def add_text_below(image, text, font, text_height=TEXT_HEIGHT):
     new_image.paste(image, (0, 0))
 
     draw = ImageDraw.Draw(new_image)
-    
-    text_box = [(0, height), (width, new_height)]
-    draw.rectangle(text_box, outline="black", width=TEXT_BOX_BORDER)
-
-    max_text_width = width - 20  
-    lines = wrap_text(draw, text, font, max_text_width)
-
-    line_height = font.getbbox("A")[3] - font.getbbox("A")[1]   
-
-    total_text_height = len(lines) * line_height
-    text_y = height + (text_height - total_text_height) // 2
-
-    for line in lines:
-        bbox = draw.textbbox((0, 0), line, font=font)
-        text_width = bbox[2] - bbox[0]
-        text_x = (width - text_width) // 2
-        draw_text_with_outline(draw, (text_x, text_y), line, font)
-        text_y += line_height
+    with metrics.timer("caption", log=False):
+        draw_caption(draw, (0, height, width, new_height), text, font)
 
     return new_image
 
@@ -104,53 +179,224 @@ def process_image(image_path, output_path, text="Sample Text"):
     print(f"Image saved at: {output_path}")
 
 
-def create_comic_strip_with_text(panel_images, panel_texts, output_image_path, is_vertical=False):
-    """Combines six images into a 3x2 comic strip or 1x6 vertical strip with multiline text on each panel."""
-
-    if len(panel_images) != 6 or len(panel_texts) != 6:
-        raise ValueError("There must be exactly 6 panel images and 6 panel texts.")
-
-    missing = [path for path in panel_images if not os.path.exists(path)]
+def render_comic(panel_images, panel_texts, comic_layout, scale=1):
+    """
+    Draws every panel and its caption straight into one preallocated canvas.
+    Panels that don't match the layout's panel size are resized to fit.
+    With scale > 1 the captions are drawn for a layout scaled down by that factor.
+    """
+    comic_strip = Image.new("RGB", comic_layout["canvas_size"], "white")
+    font = load_default_font(max(1, round(DEFAULT_FONT_SIZE / scale)))
+
+    for panel, text, cell in zip(panel_images, panel_texts, comic_layout["cells"]):
+        draw_cell(comic_strip, panel, text, cell, comic_layout["panel_size"], font, scale)
+
+    return comic_strip
+
+
+def open_reduced(panel, factor):
+    """
+    Opens a panel at 1/factor of its size, as cheaply as possible: JPEG files are
+    decoded straight at a lower resolution (draft mode), everything else is shrunk
+    with Image.reduce, which just averages factor x factor blocks.
+    """
+    img = open_panel(panel)
+    if factor <= 1:
+        return img
+    target = (max(1, img.width // factor), max(1, img.height // factor))
+    img.draft("RGB", target)
+    remaining = img.width // target[0]
+    if remaining > 1:
+        img = img.reduce(remaining)
+    if img.size != target:
+        img = img.resize(target)
+    return img
+
+
+def create_preview(panel_images, panel_texts, max_width, is_vertical=False, columns=None):
+    """
+    Composes a small version of the comic, at most max_width pixels wide, from reduced
+    panels and scaled-down captions, without ever building the full-size comic.
+    Takes a fraction of the time and memory of create_comic_strip_with_text.
+    """
+    full_layout = comic_layout_for(panel_images, is_vertical, columns)
+    factor = max(1, math.ceil(full_layout["canvas_size"][0] / max_width))
+    panels = [open_reduced(panel, factor) for panel in panel_images]
+    preview_layout = layout.compute_layout(
+        len(panels), panels[0].size, full_layout["columns"], max(1, TEXT_HEIGHT // factor)
+    )
+    return render_comic(panels, panel_texts, preview_layout, scale=factor)
+
+
+def draw_cell(canvas, panel, text, cell, panel_size, font, scale=1, top=0):
+    """
+    Draws one layout cell, a panel and its caption, into `canvas`, whose first row is
+    row `top` of the layout. The panel is pasted straight in; only the caption is
+    drawn on a small tile of its own, so a line wider than the cell (one very long
+    word) is clipped at the cell's edges instead of spilling into its neighbour.
+    A caption too tall for its box runs up over its own panel, never further.
+    """
+    image_left, image_top = cell["image_box"][:2]
+    img = open_panel(panel)
+    if img.size != panel_size:
+        img = img.resize(panel_size)
+    canvas.paste(img, (image_left, image_top - top))
+
+    left, caption_top, right, bottom = cell["caption_box"]
+    lines = caption_lines(text, font, right - left, scale)
+    overflow = len(lines) * line_height(font) - (bottom - caption_top)
+    tile_top = caption_top if overflow <= 0 else max(image_top, caption_top - overflow // 2 - line_height(font))
+
+    tile = Image.new("RGB", (right - left, bottom - tile_top), "white")
+    if tile_top < caption_top:
+        tile.paste(canvas.crop((left, tile_top - top, right, caption_top - top)), (0, 0))
+    with metrics.timer("caption", log=False):
+        draw_caption(
+            ImageDraw.Draw(tile), (0, caption_top - tile_top, right - left, bottom - tile_top),
+            text, font, scale, lines
+        )
+    canvas.paste(tile, (left, tile_top - top))
+
+
+def iter_bands(panel_images, panel_texts, comic_layout):
+    """
+    Yields a comic's rows, top to bottom, as full-width images: the canvas render_comic
+    draws, one layout row at a time, so a consumer (the streamed PNG, a PDF, a preview)
+    never holds more than one row. Panels given as paths are opened row by row.
+    """
+    width = comic_layout["canvas_size"][0]
+    font = load_default_font(DEFAULT_FONT_SIZE)
+    cells = comic_layout["cells"]
+    for row_start in range(0, len(cells), comic_layout["columns"]):
+        row = range(row_start, min(row_start + comic_layout["columns"], len(cells)))
+        top = cells[row_start]["image_box"][1]
+        band = Image.new("RGB", (width, cells[row_start]["caption_box"][3] - top), "white")
+        for i in row:
+            draw_cell(band, panel_images[i], panel_texts[i], cells[i], comic_layout["panel_size"], font, top=top)
+        yield band
+
+
+def redraw_panel(comic_strip, comic_layout, index, panel, text):
+    """
+    Re-renders a single cell of an already composed comic in place (e.g. after its
+    image was regenerated or its caption edited), leaving every other pixel untouched.
+    Returns the comic.
+    """
+    draw_cell(
+        comic_strip, panel, text, comic_layout["cells"][index], comic_layout["panel_size"],
+        load_default_font(DEFAULT_FONT_SIZE)
+    )
+    return comic_strip
+
+
+def write_vertical_strip(panel_images, panel_texts, output_image_path, slice_dir=None, slice_format="JPEG", band_writers=()):
+    """
+    Streams a vertical (webtoon) strip to a PNG one panel-sized band at a time, so peak
+    memory stays at about one panel however long the strip is. Panels given as paths
+    are only opened when their band is drawn. Each band is also passed to the
+    write_band() of every one of `band_writers` (e.g. export.band_writers), so other
+    outputs are built in the same pass without rendering the strip again.
+
+    With slice_dir, each band is also saved there as its own image, together with
+    strip.json (the slice list) and strip.html (lazy-loading <img> tags) for browsers.
+    Returns the manifest of the strip.
+    """
+    first_panel = open_panel(panel_images[0])
+    comic_layout = layout.compute_layout(len(panel_images), first_panel.size, 1, TEXT_HEIGHT)
+    width, height = comic_layout["canvas_size"]
+    extension = "jpg" if slice_format.upper() == "JPEG" else slice_format.lower()
+
+    manifest = {"width": width, "height": height, "image": output_image_path, "slices": []}
+    if slice_dir:
+        os.makedirs(slice_dir, exist_ok=True)
+
+    with open(output_image_path, "wb") as fp:
+        writer = StreamingPNGWriter(fp, width, height)
+        bands = iter_bands([first_panel] + list(panel_images[1:]), panel_texts, comic_layout)
+        for i, (band, cell) in enumerate(zip(bands, comic_layout["cells"])):
+            # A single column: every cell spans the full width, so a cell is a band
+            top = cell["image_box"][1]
+            band_height = band.height
+            writer.write_band(band)
+            for band_writer in band_writers:
+                band_writer.write_band(band)
+
+            if slice_dir:
+                slice_name = f"slice_{i+1}.{extension}"
+                band.save(os.path.join(slice_dir, slice_name), slice_format)
+                manifest["slices"].append({"src": slice_name, "top": top, "width": width, "height": band_height})
+        writer.close()
+
+    if slice_dir:
+        with open(os.path.join(slice_dir, "strip.json"), "w") as f:
+            json.dump(manifest, f, indent=2)
+        with open(os.path.join(slice_dir, "strip.html"), "w") as f:
+            f.write("".join(
+                f'<img src="{entry["src"]}" width="{entry["width"]}" height="{entry["height"]}" loading="lazy" style="display:block"/>\n'
+                for entry in manifest["slices"]
+            ))
+
+    print(f"Comic strip streamed to {output_image_path} (Layout: Vertical, {len(panel_images)} panels)")
+    return manifest
+
+
+def comic_layout_for(panel_images, is_vertical=False, columns=None):
+    """Returns the layout create_comic_strip_with_text uses for these panels."""
+    if columns is None:
+        columns = "vertical" if is_vertical else "grid"
+    # Every cell takes the size of the first panel; only its header is read here
+    panel_size = open_panel(panel_images[0]).size
+    return layout.compute_layout(len(panel_images), panel_size, layout.columns_for(columns), TEXT_HEIGHT)
+
+
+def create_comic_strip_with_text(panel_images, panel_texts, output_image_path=None, is_vertical=False, columns=None, stream=False, band_writers=(), slice_dir=None):
+    """
+    Combines panel images into a grid (3x2 for six panels) or a vertical strip with multiline text on each panel.
+    Any number of panels works; `columns` overrides the grid width (a layout.TEMPLATES name or a number).
+    Panels may be PIL images, encoded image bytes or file paths. Returns the comic strip image,
+    and also saves it when output_image_path is given.
+    With stream=True a vertical strip is written band by band by write_vertical_strip
+    instead of being built in memory, and None is returned; its bands are also passed
+    to `band_writers`, and with slice_dir saved there as a lazy-loading slice set.
+    """
+
+    if not panel_images or len(panel_images) != len(panel_texts):
+        raise ValueError("There must be at least one panel image and exactly one panel text per image.")
+
+    missing = [
+        path for path in panel_images
+        if isinstance(path, (str, os.PathLike)) and not os.path.exists(path)
+    ]
     if missing:
         print("Missing image files:", missing)
         raise FileNotFoundError("Some panel images are missing!")
 
-    # Processing each panel
-    processed_panels = []
-    for i in range(6):
-        img = Image.open(panel_images[i])
-        font = load_default_font(DEFAULT_FONT_SIZE)
-        img_with_text = add_text_below(img, panel_texts[i], font)
-        processed_panels.append(img_with_text)
-
-    width, height = processed_panels[0].size
-    
-    # Determine layout dimensions
-    if is_vertical:
-        # Vertical Strip (Webtoon style): 1 column x 6 rows
-        comic_width = width
-        comic_height = height * 6
-    else:
-        # Classic Grid: 2 columns x 3 rows
-        comic_width = width * 2      
-        comic_height = height * 3
-    
-    comic_strip = Image.new("RGB", (comic_width, comic_height), "white")
-
-    for i, panel in enumerate(processed_panels):
-        if is_vertical:
-            # Stack vertically
-            x = 0
-            y = i * height
-        else:
-            # 3x2 grid layout
-            x = (i % 2) * width     
-            y = (i // 2) * height
-        
-        comic_strip.paste(panel, (x, y))
-
-    comic_strip.save(output_image_path)
-    print(f"Comic strip saved at {output_image_path} (Layout: {'Vertical' if is_vertical else '3x2 Grid'})")
+    if columns is None:
+        columns = "vertical" if is_vertical else "grid"
+
+    if stream and layout.columns_for(columns) == 1:
+        if not output_image_path:
+            raise ValueError("A streamed strip needs an output_image_path.")
+        with metrics.timer("compose", layout="vertical_stream", panels=len(panel_images)):
+            write_vertical_strip(
+                panel_images, panel_texts, output_image_path, slice_dir=slice_dir, band_writers=band_writers
+            )
+        return None
+
+    with metrics.timer("compose", layout="grid" if layout.columns_for(columns) > 1 else "vertical") as log_fields:
+        first_panel = open_panel(panel_images[0])
+        comic_layout = comic_layout_for(panel_images, is_vertical, columns)
+        panel_images = [first_panel] + list(panel_images[1:])
+        comic_strip = render_comic(panel_images, panel_texts, comic_layout)
+        log_fields["canvas_size"] = comic_layout["canvas_size"]
+
+    if output_image_path:
+        with metrics.timer("encode", format="png"):
+            comic_strip.save(output_image_path)
+        layout_name = "Vertical" if comic_layout["columns"] == 1 else f"{comic_layout['rows']}x{comic_layout['columns']} Grid"
+        print(f"Comic strip saved at {output_image_path} (Layout: {layout_name})")
+
+    return comic_strip
 
 
 if __name__ == "__main__":
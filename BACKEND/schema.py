@@ -0,0 +1,87 @@
+TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "integer": int,
+    "number": (int, float),
+    "boolean": bool,
+    "null": type(None),
+}
+
+
+class SchemaError(ValueError):
+    """A value that doesn't match its schema. The message starts with the path of the offending value."""
+
+
+def compile_schema(schema):
+    """
+    Turns a JSON schema into a validator function, validate(value), that raises
+    SchemaError on the first mismatch. The schema is interpreted once, here: the
+    validator is a tree of small checks, so validating a document is a single walk
+    over it. Supports the subset the panel scripts use (type, properties, required,
+    items, minItems, maxItems, minLength, maxLength, enum); other keywords are ignored,
+    so extra properties are let through rather than rejected.
+    """
+    checks = []
+
+    kind = schema.get("type")
+    if kind is not None:
+        expected = TYPES[kind]
+
+        def check_type(value, path):
+            # bool is an int subclass, but JSON keeps them apart
+            if not isinstance(value, expected) or (isinstance(value, bool) and kind != "boolean"):
+                raise SchemaError(f"{path}: expected {kind}, got {type(value).__name__}")
+        checks.append(check_type)
+
+    if "enum" in schema:
+        allowed = schema["enum"]
+
+        def check_enum(value, path):
+            if value not in allowed:
+                raise SchemaError(f"{path}: {value!r} is not one of {allowed!r}")
+        checks.append(check_enum)
+
+    if "minLength" in schema or "maxLength" in schema:
+        min_length = schema.get("minLength", 0)
+        max_length = schema.get("maxLength")
+
+        def check_length(value, path):
+            length = len(value)
+            if length < min_length or (max_length is not None and length > max_length):
+                raise SchemaError(f"{path}: length {length} is outside {min_length}..{max_length}")
+        checks.append(check_length)
+
+    required = tuple(schema.get("required", ()))
+    properties = {name: compile_schema(sub) for name, sub in schema.get("properties", {}).items()}
+    if required or properties:
+        def check_object(value, path):
+            for name in required:
+                if name not in value:
+                    raise SchemaError(f"{path}: missing property {name!r}")
+            for name, validate in properties.items():
+                if name in value:
+                    validate(value[name], f"{path}.{name}")
+        checks.append(check_object)
+
+    if "minItems" in schema or "maxItems" in schema:
+        min_items = schema.get("minItems", 0)
+        max_items = schema.get("maxItems")
+
+        def check_count(value, path):
+            if len(value) < min_items or (max_items is not None and len(value) > max_items):
+                raise SchemaError(f"{path}: {len(value)} items, expected {min_items}..{max_items}")
+        checks.append(check_count)
+
+    if "items" in schema:
+        validate_item = compile_schema(schema["items"])
+
+        def check_items(value, path):
+            for i, item in enumerate(value):
+                validate_item(item, f"{path}[{i}]")
+        checks.append(check_items)
+
+    def validate(value, path="$"):
+        for check in checks:
+            check(value, path)
+    return validate
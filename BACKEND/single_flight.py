@@ -0,0 +1,114 @@
+import threading
+from concurrent.futures import Future
+
+try:
+    from . import metrics
+except ImportError:
+    import metrics
+
+
+class AbandonedCallError(Exception):
+    """Raised to followers when the caller that was running their shared call stopped before it finished."""
+
+
+class _Broadcast:
+    """The items of one shared stream, as far as the leader has read it."""
+
+    def __init__(self):
+        self.items = []
+        self.finished = False
+        self.error = None
+        self.condition = threading.Condition()
+
+
+class SingleFlight:
+    """
+    Shares identical in-flight calls between threads. The first caller of a key (the
+    leader) does the work; callers arriving with the same key while it runs (followers)
+    wait for the leader's result instead of repeating the call, and see its exception
+    if it fails. Nothing is kept once the call finishes: a later caller starts afresh,
+    normally to find the result in a cache the leader filled.
+    Results are shared, not copied, so callers must not modify them.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def _join(self, key, make_call):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                metrics.count("comic_shared_requests_total", service=self.name)
+                return call, False
+            call = self._calls[key] = make_call()
+            return call, True
+
+    def _leave(self, key):
+        with self._lock:
+            self._calls.pop(key, None)
+
+    def do(self, key, fn, *args, **kwargs):
+        """Returns fn(*args, **kwargs), or the result of the same call already running under `key`."""
+        key = ("do", key)
+        call, leader = self._join(key, Future)
+        if not leader:
+            return call.result()
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            self._leave(key)
+
+    def stream(self, key, fn, *args, **kwargs):
+        """
+        Generator version of do() for a function returning an iterator: followers get
+        every item the leader has read so far at once, then each new one as it arrives.
+        The leader's iteration drives the call, so if the leader stops early its
+        followers get an AbandonedCallError.
+        """
+        key = ("stream", key)
+        call, leader = self._join(key, _Broadcast)
+        if not leader:
+            yield from self._follow(call)
+            return
+
+        completed = False
+        try:
+            for item in fn(*args, **kwargs):
+                with call.condition:
+                    call.items.append(item)
+                    call.condition.notify_all()
+                yield item
+            completed = True
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            if not completed and call.error is None:
+                call.error = AbandonedCallError(f"The shared {self.name} call was stopped before it finished.")
+            self._leave(key)
+            with call.condition:
+                call.finished = True
+                call.condition.notify_all()
+
+    def _follow(self, call):
+        position = 0
+        while True:
+            with call.condition:
+                call.condition.wait_for(lambda: position < len(call.items) or call.finished)
+                items = call.items[position:]
+                finished = call.finished
+            yield from items
+            position += len(items)
+            if finished and position == len(call.items):
+                if call.error is not None:
+                    raise call.error
+                return
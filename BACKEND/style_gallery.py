@@ -0,0 +1,61 @@
+import base64
+import io
+import os
+import threading
+
+from PIL import Image
+
+THUMBNAIL_WIDTH = 360  # px; the style cards are shown at most ~300px wide
+THUMBNAIL_QUALITY = 85
+
+# path -> (modification time, base64 JPEG or None when the sample is missing/unreadable)
+_thumbnails = {}
+_lock = threading.Lock()
+
+
+def _build_thumbnail(path):
+    """Crops the top-right panel of a 3x2 sample comic and returns it as a base64 JPEG."""
+    with Image.open(path) as full_img:
+        width, height = full_img.size
+        # Let the JPEG decoder scale down while decoding instead of inflating the full image
+        full_img.draft("RGB", (THUMBNAIL_WIDTH * 2, THUMBNAIL_WIDTH * 2 * height // width))
+        width, height = full_img.size
+        single_panel = full_img.crop((width // 2, 0, width, height // 3))
+        single_panel.thumbnail((THUMBNAIL_WIDTH, THUMBNAIL_WIDTH))
+
+        buffered = io.BytesIO()
+        single_panel.convert("RGB").save(buffered, format="JPEG", quality=THUMBNAIL_QUALITY)
+    return base64.b64encode(buffered.getvalue()).decode()
+
+
+def style_thumbnail(path):
+    """
+    Returns the base64 JPEG thumbnail for a style sample, or None if the sample
+    is missing or unreadable. Thumbnails are built once and served from memory
+    until the file's modification time changes; a missing file costs one stat().
+    """
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        mtime = None
+
+    with _lock:
+        cached = _thumbnails.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    thumbnail = None
+    if mtime is not None:
+        try:
+            thumbnail = _build_thumbnail(path)
+        except Exception as e:
+            print(f"Could not build a thumbnail for {path}: {e}")
+
+    with _lock:
+        _thumbnails[path] = (mtime, thumbnail)
+    return thumbnail
+
+
+def build_index(paths):
+    """Builds (or refreshes) the thumbnails for every sample path up front."""
+    return {path: style_thumbnail(path) for path in paths}
@@ -0,0 +1,75 @@
+"""
+Composition throughput: threads in one process vs. the composition process pool.
+
+Composes and exports N comics (grid layout, PNG + PDF + preview) from synthetic
+1024x1024 panels, first on a thread pool with COMPOSE_WORKERS=0 (everything under
+one GIL, as before the pool existed), then through compose_pool. Prints comics
+per minute for each; the pool should scale with the number of cores.
+
+Usage, from the repository root:
+    python -m BENCHMARKS.bench_compose_pool --comics 16
+"""
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from BACKEND import compose_pool, pipeline
+
+PANEL_SIZE = (1024, 1024)
+
+
+def make_panels(count=6):
+    panels = []
+    for i in range(count):
+        noise = Image.effect_noise(PANEL_SIZE, 40 + i).convert("RGB")
+        gradient = Image.linear_gradient("L").resize(PANEL_SIZE).convert("RGB")
+        panels.append(Image.blend(noise, gradient, 0.5))
+    return panels
+
+
+def run(comics, panels, work_dir, workers):
+    panel_data = [{"Description": "", "Text": f"Panel {i + 1}: this is a caption that wraps onto two lines"} for i in range(len(panels))]
+
+    def one(n):
+        directory = os.path.join(work_dir, f"comic_{n}")
+        os.makedirs(directory, exist_ok=True)
+        paths = {
+            "comic": os.path.join(directory, "comic.png"),
+            "pdf": os.path.join(directory, "comic.pdf"),
+            "preview": os.path.join(directory, "preview.jpg"),
+        }
+        return compose_pool.submit(pipeline.compose_and_export, panels, panel_data, paths).result()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(one, range(comics)))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare composition throughput with and without the process pool.")
+    parser.add_argument("--comics", type=int, default=8)
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    panels = make_panels()
+    with tempfile.TemporaryDirectory(prefix="comic-compose-") as work_dir:
+        pool_workers = compose_pool.COMPOSE_WORKERS
+        compose_pool.COMPOSE_WORKERS = 0
+        inline = run(args.comics, panels, work_dir, cores)
+        compose_pool.COMPOSE_WORKERS = max(pool_workers, 1)
+        # Warm the pool up so process start-up isn't counted
+        run(1, panels, work_dir, 1)
+        pooled = run(args.comics, panels, work_dir, cores)
+
+    print(f"{cores} cores, {args.comics} comics")
+    print(f"threads only : {args.comics * 60 / inline:6.1f} comics/min ({inline:.1f}s)")
+    print(f"process pool : {args.comics * 60 / pooled:6.1f} comics/min ({pooled:.1f}s) with {compose_pool.COMPOSE_WORKERS} workers")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Benchmark and pixel-diff check for outlined captions in BACKEND/process_comic.py.
+
+Renders the same caption with the original 25-draw outline loop and with the
+current draw_text_with_outline, for FreeType and bitmap fonts at several outline
+thicknesses. Prints timings and how far the output drifts from the original, and
+exits non-zero if any case differs by more than the thresholds below.
+
+Usage, from the repository root:
+    python -m BENCHMARKS.bench_outline_text
+"""
+import sys
+import timeit
+
+from PIL import Image, ImageChops, ImageDraw, ImageFont
+
+from BACKEND import process_comic
+
+CAPTION = "Captain: we have to reach the lighthouse before midnight!"
+CANVAS_SIZE = (1400, 140)
+BACKGROUND = (200, 60, 60)
+THICKNESSES = (1, 2, 4, 8)
+REPEATS = 5
+
+# A pixel "differs" when any channel is off by more than this much
+PIXEL_TOLERANCE = 64
+# Fraction of differing pixels allowed per case (edges of antialiased glyphs)
+MAX_DIFFERING_FRACTION = 0.02
+
+
+def legacy_draw_text_with_outline(draw, position, text, font, fill_color="black", outline_color="white", outline_thickness=2):
+    """The original outline renderer: one draw per offset in a square around the text."""
+    x, y = position
+    for dx in range(-outline_thickness, outline_thickness + 1):
+        for dy in range(-outline_thickness, outline_thickness + 1):
+            if dx != 0 or dy != 0:
+                draw.text((x + dx, y + dy), text, font=font, fill=outline_color)
+    draw.text((x, y), text, font=font, fill=fill_color)
+
+
+def render(renderer, font, thickness):
+    image = Image.new("RGB", CANVAS_SIZE, BACKGROUND)
+    renderer(ImageDraw.Draw(image), (20, 40), CAPTION, font, outline_thickness=thickness)
+    return image
+
+
+def differing_fraction(a, b):
+    diff = ImageChops.difference(a, b).convert("L")
+    histogram = diff.histogram()
+    return sum(histogram[PIXEL_TOLERANCE + 1:]) / sum(histogram)
+
+
+def main():
+    fonts = {"bitmap": ImageFont.load_default_imagefont()}
+    try:
+        fonts["freetype"] = ImageFont.load_default(process_comic.DEFAULT_FONT_SIZE)
+    except (AttributeError, TypeError, OSError):
+        print("FreeType is not available; only the bitmap path is checked.")
+
+    failures = 0
+    print(f"{'font':<9} {'thickness':>9} {'legacy ms':>10} {'current ms':>11} {'speedup':>8} {'diff px':>8}")
+    for font_name, font in fonts.items():
+        for thickness in THICKNESSES:
+            legacy_s = min(timeit.repeat(
+                lambda: render(legacy_draw_text_with_outline, font, thickness), number=10, repeat=REPEATS
+            )) / 10
+            current_s = min(timeit.repeat(
+                lambda: render(process_comic.draw_text_with_outline, font, thickness), number=10, repeat=REPEATS
+            )) / 10
+            fraction = differing_fraction(
+                render(legacy_draw_text_with_outline, font, thickness),
+                render(process_comic.draw_text_with_outline, font, thickness),
+            )
+            ok = fraction <= MAX_DIFFERING_FRACTION
+            failures += not ok
+            print(
+                f"{font_name:<9} {thickness:>9} {legacy_s * 1000:>10.2f} {current_s * 1000:>11.2f} "
+                f"{legacy_s / current_s:>7.1f}x {fraction:>7.2%}{'' if ok else '  FAIL'}"
+            )
+
+    if failures:
+        print(f"\n{failures} case(s) differ from the original outline by more than {MAX_DIFFERING_FRACTION:.0%} of pixels.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Cold-start benchmark for the backend modules, based on `python -X importtime`.
+
+Imports each target in a fresh interpreter (so nothing is already in sys.modules),
+with the API keys removed from the environment to prove that importing needs
+neither keys nor network. Reports the median cumulative import time of each target
+over several runs, the modules that cost the most, and whether any directory was
+created by importing. Exits non-zero if an import fails or exceeds --budget-ms.
+
+Usage, from the repository root:
+    python -m BENCHMARKS.bench_startup
+    python -m BENCHMARKS.bench_startup --runs 10 --budget-ms 150 --output startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+TARGETS = (
+    "BACKEND.jobs",
+    "BACKEND.pipeline",
+    "BACKEND.generate_panels",
+    "BACKEND.generate_image",
+    "BACKEND.process_comic",
+    "BACKEND.export",
+    "BACKEND.style_gallery",
+)
+# Modules that should only be imported once they are actually used
+LAZY_MODULES = ("reportlab", "requests", "http.server")
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_importtime(stderr):
+    """Returns {module: (self_us, cumulative_us)} from -X importtime output."""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def import_once(target):
+    """Imports target in a fresh interpreter from an empty working directory."""
+    env = dict(os.environ)
+    for name in ("OPENROUTER_API_KEY", "CLIPDROP_API_KEY"):
+        env.pop(name, None)
+    env["PYTHONPATH"] = REPO_ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+
+    with tempfile.TemporaryDirectory(prefix="comic-startup-") as work_dir:
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+            cwd=work_dir, env=env, capture_output=True, text=True
+        )
+        created = sorted(os.listdir(work_dir))
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return parse_importtime(result.stderr), created
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure backend import (cold start) time.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8, help="How many of the most expensive modules to list")
+    parser.add_argument("--budget-ms", type=float, default=None, help="Fail if any target takes longer to import")
+    parser.add_argument("--output", help="Write the results as JSON to this path")
+    parser.add_argument("targets", nargs="*", default=list(TARGETS))
+    args = parser.parse_args()
+
+    report = {"python": sys.version.split()[0], "runs": args.runs, "targets": {}}
+    failed = False
+    for target in args.targets:
+        samples = []
+        self_times = {}
+        try:
+            for _ in range(args.runs):
+                modules, created = import_once(target)
+                samples.append(modules[target][1] / 1000)
+                for name, (self_us, _) in modules.items():
+                    self_times.setdefault(name, []).append(self_us / 1000)
+        except RuntimeError as e:
+            print(f"{target:<26} import failed: {e}")
+            report["targets"][target] = {"error": str(e)}
+            failed = True
+            continue
+
+        median_ms = statistics.median(samples)
+        heaviest = sorted(
+            ((name, statistics.median(times)) for name, times in self_times.items()),
+            key=lambda entry: entry[1], reverse=True
+        )[:args.top]
+        eager = [name for name in LAZY_MODULES if name in self_times]
+        report["targets"][target] = {
+            "median_ms": median_ms,
+            "min_ms": min(samples),
+            "max_ms": max(samples),
+            "heaviest_modules_ms": dict(heaviest),
+            "eager_lazy_modules": eager,
+            "created_at_import": created,
+        }
+
+        print(f"{target:<26} median {median_ms:7.1f} ms  (min {min(samples):.1f}, max {max(samples):.1f})")
+        for name, ms in heaviest:
+            print(f"    {ms:7.2f} ms  {name}")
+        if eager:
+            print(f"    imported eagerly: {', '.join(eager)}")
+        if created:
+            print(f"    created at import: {', '.join(created)}")
+            failed = True
+        if args.budget_ms is not None and median_ms > args.budget_ms:
+            print(f"    over the {args.budget_ms:.0f} ms budget")
+            failed = True
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
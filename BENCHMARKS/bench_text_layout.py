@@ -0,0 +1,73 @@
+"""
+Microbenchmark for caption layout in BACKEND/process_comic.py.
+
+Compares the original wrap_text (re-measures the growing line with textbbox
+for every word) against the current one (cached per-word widths), plus the
+cost of loading the caption font per panel versus once per process.
+
+Usage, from the repository root:
+    python -m BENCHMARKS.bench_text_layout
+"""
+import timeit
+
+from PIL import Image, ImageDraw, ImageFont
+
+from BACKEND import process_comic
+
+PANEL_WIDTH = 1024
+REPEATS = 5
+
+
+def legacy_wrap_text(draw, text, font, max_width):
+    """The wrap_text implementation before font/width caching, kept for comparison."""
+    lines = []
+    current_line = ""
+    for word in text.split():
+        test_line = f"{current_line} {word}".strip()
+        bbox = draw.textbbox((0, 0), test_line, font=font)
+        if bbox[2] - bbox[0] <= max_width:
+            current_line = test_line
+        else:
+            lines.append(current_line)
+            current_line = word
+    if current_line:
+        lines.append(current_line)
+    return lines
+
+
+def load_legacy_font(size):
+    """Uncached font loading, as every panel used to do."""
+    try:
+        return ImageFont.truetype("arial.ttf", size)
+    except OSError:
+        return ImageFont.load_default()
+
+
+def bench(label, fn, number):
+    best = min(timeit.repeat(fn, number=number, repeat=REPEATS))
+    per_call_us = best / number * 1e6
+    print(f"{label:<42} {per_call_us:>10.1f} us/call")
+    return per_call_us
+
+
+def main():
+    font = process_comic.load_default_font(process_comic.DEFAULT_FONT_SIZE)
+    draw = ImageDraw.Draw(Image.new("RGB", (PANEL_WIDTH, process_comic.TEXT_HEIGHT)))
+    max_width = PANEL_WIDTH - 20
+
+    for words in (12, 60, 240):
+        dialogue = " ".join(["Captain:", "we", "have", "to", "reach", "the", "lighthouse", "before", "midnight!"] * (words // 9 + 1))
+        dialogue = " ".join(dialogue.split()[:words])
+        print(f"\nDialogue of {words} words")
+        legacy = bench("legacy wrap_text (textbbox per prefix)", lambda: legacy_wrap_text(draw, dialogue, font, max_width), 50)
+        current = bench("wrap_text (cached word widths)", lambda: process_comic.wrap_text(draw, dialogue, font, max_width), 50)
+        print(f"{'speedup':<42} {legacy / current:>10.1f}x")
+
+    print("\nFont loading, per panel")
+    legacy = bench("uncached truetype()/load_default()", lambda: load_legacy_font(process_comic.DEFAULT_FONT_SIZE), 200)
+    current = bench("load_default_font (process-wide cache)", lambda: process_comic.load_default_font(process_comic.DEFAULT_FONT_SIZE), 200)
+    print(f"{'speedup':<42} {legacy / current:>10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
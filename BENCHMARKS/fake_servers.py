@@ -0,0 +1,285 @@
+"""
+Local stand-ins for the ClipDrop text-to-image API and the OpenRouter chat
+completions API, for running the pipeline offline.
+
+Both servers speak just enough of the real protocols for BACKEND/ to use them
+unchanged (point CLIPDROP_URL and OPENROUTER_URL at them): ClipDrop answers a
+multipart POST with a PNG, OpenRouter answers a chat completion as plain JSON
+or as a server-sent-events stream. Latency, error rate and image size follow a
+named profile (see PROFILES) and every random draw comes from a seeded RNG, so
+two runs with the same profile see the same sequence of delays and failures.
+
+Usage, from the repository root:
+    python -m BENCHMARKS.fake_servers --profile realistic
+"""
+import argparse
+import hashlib
+import io
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image, ImageDraw
+
+# Latencies are lognormal: (median seconds, sigma). Error rates are per request.
+PROFILES = {
+    # Close to what the live services show: a few seconds per image, ~1s to the first token
+    "realistic": {
+        "image_latency": (6.0, 0.35),
+        "image_error_rate": 0.03,
+        "image_size": (1024, 1024),
+        "llm_first_token": (0.8, 0.4),
+        "llm_tokens_per_second": 60,
+        "llm_error_rate": 0.01,
+    },
+    # Same shape, ~50x faster, for quick regression runs
+    "fast": {
+        "image_latency": (0.12, 0.35),
+        "image_error_rate": 0.0,
+        "image_size": (1024, 1024),
+        "llm_first_token": (0.02, 0.4),
+        "llm_tokens_per_second": 3000,
+        "llm_error_rate": 0.0,
+    },
+    # Fast, but one image call in five fails
+    "flaky": {
+        "image_latency": (0.12, 0.35),
+        "image_error_rate": 0.2,
+        "image_size": (1024, 1024),
+        "llm_first_token": (0.02, 0.4),
+        "llm_tokens_per_second": 3000,
+        "llm_error_rate": 0.05,
+    },
+}
+
+IMAGE_PATH = "/text-to-image/v1"
+CHAT_PATH = "/api/v1/chat/completions"
+IMAGE_VARIANTS = 4
+WORDS_PER_STREAM_CHUNK = 3
+
+SCENES = (
+    "rainy neon street, lone detective in a trench coat, reflections on wet asphalt",
+    "cluttered laboratory, young scientist holding a glowing vial, sparks in the air",
+    "rooftop at dusk, two friends sitting on the ledge, city lights below",
+    "dense jungle, explorer pushing aside giant leaves, ancient temple in the distance",
+    "crowded market, merchant waving a fish, curious cat on a crate",
+    "quiet library, old librarian peering over glasses, dust in a sunbeam",
+)
+LINES = (
+    "Narrator: It started like any other night.",
+    "Hero: Did you hear that?",
+    "...",
+    "Sidekick: I told you this was a bad idea!",
+    "Villain: You're too late.",
+    "Hero: Not this time.",
+)
+
+
+def make_png(size, seed):
+    """Renders a PNG with enough texture to compress like a real generated image."""
+    rng = random.Random(seed)
+    width, height = size
+    noise = Image.effect_noise(size, 48).convert("RGB")
+    gradient = Image.linear_gradient("L").resize(size).convert("RGB")
+    image = Image.blend(noise, gradient, 0.55)
+    draw = ImageDraw.Draw(image)
+    for _ in range(24):
+        x, y = rng.randrange(width), rng.randrange(height)
+        radius = rng.randrange(20, width // 4)
+        color = tuple(rng.randrange(256) for _ in range(3))
+        draw.ellipse((x - radius, y - radius, x + radius, y + radius), fill=color)
+    image = Image.blend(image, noise, 0.25)
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def make_script(prompt, schema=None):
+    """
+    Writes a script chosen by the prompt's hash: six panels in the "# Panel N" format
+    TEMPLATE asks for or, when the request carries a JSON schema (response_format),
+    a {"panels": [...]} object with as many panels as the schema requires.
+    """
+    seed = int(hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8], 16)
+    rng = random.Random(seed)
+    if schema is not None:
+        count = schema["properties"]["panels"]["minItems"]
+        panels = [{"description": rng.choice(SCENES), "text": rng.choice(LINES)} for _ in range(count)]
+        return json.dumps({"panels": panels}, indent=1)
+    blocks = []
+    for i in range(6):
+        line = rng.choice(LINES)
+        blocks.append(f'# Panel {i + 1}\nDescription: {rng.choice(SCENES)}\nText: "{line}"\n')
+    return "\n".join(blocks) + "\n# end\n"
+
+
+class FakeServers:
+    """
+    Runs both stand-ins on ephemeral localhost ports in background threads.
+    Use as a context manager; clipdrop_url and openrouter_url are set once started.
+    """
+
+    def __init__(self, profile="fast", seed=0):
+        if profile not in PROFILES:
+            raise ValueError(f"Unknown profile! Choose from: {', '.join(PROFILES.keys())}.")
+        self.profile = PROFILES[profile]
+        self.profile_name = profile
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._images = [make_png(self.profile["image_size"], seed + i) for i in range(IMAGE_VARIANTS)]
+        self.stats = {"image_requests": 0, "image_errors": 0, "chat_requests": 0, "chat_errors": 0, "bytes_sent": 0}
+        self._server = None
+        self._thread = None
+        self.clipdrop_url = None
+        self.openrouter_url = None
+
+    def _draw(self, kind, *args):
+        with self._rng_lock:
+            return getattr(self._rng, kind)(*args)
+
+    def latency(self, key):
+        median, sigma = self.profile[key]
+        return median * self._draw("lognormvariate", 0.0, sigma)
+
+    def fails(self, key):
+        return self._draw("random") < self.profile[key]
+
+    def _count(self, **increments):
+        with self._rng_lock:
+            for name, value in increments.items():
+                self.stats[name] += value
+
+    def start(self):
+        servers = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                if self.path == IMAGE_PATH:
+                    servers.handle_image(self, body)
+                elif self.path == CHAT_PATH:
+                    servers.handle_chat(self, body)
+                else:
+                    self.send_json(404, {"error": "not found"})
+
+            def send_json(self, status, payload, extra_headers=None):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (extra_headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+                servers._count(bytes_sent=len(data))
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        base = f"http://127.0.0.1:{self._server.server_address[1]}"
+        self.clipdrop_url = base + IMAGE_PATH
+        self.openrouter_url = base + CHAT_PATH
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-servers", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def handle_image(self, handler, body):
+        self._count(image_requests=1)
+        time.sleep(self.latency("image_latency"))
+        if self.fails("image_error_rate"):
+            self._count(image_errors=1)
+            # ClipDrop mostly fails with rate limiting, occasionally with a server error
+            if self._draw("random") < 0.7:
+                handler.send_json(429, {"error": "Too many requests"}, {"Retry-After": "1"})
+            else:
+                handler.send_json(500, {"error": "Internal server error"})
+            return
+
+        image = self._images[int(hashlib.sha256(body).hexdigest()[:8], 16) % len(self._images)]
+        handler.send_response(200)
+        handler.send_header("Content-Type", "image/png")
+        handler.send_header("Content-Length", str(len(image)))
+        handler.end_headers()
+        handler.wfile.write(image)
+        self._count(bytes_sent=len(image))
+
+    def handle_chat(self, handler, body):
+        self._count(chat_requests=1)
+        request = json.loads(body or b"{}")
+        prompt = request.get("messages", [{}])[-1].get("content", "")
+        response_format = request.get("response_format") or {}
+        script = make_script(prompt, response_format.get("json_schema", {}).get("schema"))
+        time.sleep(self.latency("llm_first_token"))
+        if self.fails("llm_error_rate"):
+            self._count(chat_errors=1)
+            handler.send_json(502, {"error": {"message": "Upstream provider error"}})
+            return
+
+        if not request.get("stream"):
+            # Without streaming the whole completion has to be generated before anything is sent
+            time.sleep(len(script.split()) / self.profile["llm_tokens_per_second"])
+            handler.send_json(200, {"choices": [{"message": {"role": "assistant", "content": script}}]})
+            return
+
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Connection", "close")
+        handler.end_headers()
+        handler.wfile.write(b": OPENROUTER PROCESSING\n\n")
+        # Split on spaces but keep them, so the chunks join back into the exact script
+        words = script.split(" ")
+        for start in range(0, len(words), WORDS_PER_STREAM_CHUNK):
+            chunk = " ".join(words[start:start + WORDS_PER_STREAM_CHUNK])
+            if start + WORDS_PER_STREAM_CHUNK < len(words):
+                chunk += " "
+            time.sleep(WORDS_PER_STREAM_CHUNK / self.profile["llm_tokens_per_second"])
+            event = {"choices": [{"delta": {"content": chunk}}]}
+            data = f"data: {json.dumps(event)}\n\n".encode("utf-8")
+            try:
+                handler.wfile.write(data)
+                handler.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                # The client stops reading once it has all six panels
+                return
+            self._count(bytes_sent=len(data))
+        handler.wfile.write(b"data: [DONE]\n\n")
+        handler.close_connection = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the fake ClipDrop and OpenRouter servers in the foreground.")
+    parser.add_argument("--profile", default="realistic", choices=sorted(PROFILES))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with FakeServers(args.profile, args.seed) as servers:
+        print(f"CLIPDROP_URL={servers.clipdrop_url}")
+        print(f"OPENROUTER_URL={servers.openrouter_url}")
+        print("Press Ctrl+C to stop.")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+Offline end-to-end benchmark of the comic pipeline.
+
+Starts the fake ClipDrop and OpenRouter servers from BENCHMARKS/fake_servers.py,
+points BACKEND/ at them, and times each stage on its own and the whole pipeline
+end to end:
+
+    panels       generate_panels (one non-streamed completion)
+    panels_stream iter_panels (streamed; also records time to the first panel)
+    images       generate_panel_results for six panels, caches cleared each run
+    compose      create_comic_strip_with_text, grid layout in memory
+    compose_vertical create_comic_strip_with_text, vertical strip streamed to disk
+    pdf          export.create_pdf, one layout row per page
+    export       export.export_comic (image formats, PDF and preview together)
+    end_to_end   pipeline.run_comic, as a job worker runs it
+
+Caches and job artifacts live in a temporary directory and are cleared before
+every iteration, so each run pays for every request. Results (min/median/p95/
+mean/max seconds per stage, failure counts, payload sizes and the server
+profile) are written as JSON for comparing runs.
+
+Usage, from the repository root:
+    python -m BENCHMARKS.run_benchmarks --profile fast --iterations 5
+    python -m BENCHMARKS.run_benchmarks --profile realistic --stages images end_to_end
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+from BENCHMARKS.fake_servers import PROFILES, FakeServers
+
+STAGES = ("panels", "panels_stream", "images", "compose", "compose_vertical", "pdf", "export", "end_to_end")
+SCENARIO = "A detective and her robot partner chase a thief across the rooftops of a rainy city."
+ART_STYLE = "American"
+DEFAULT_OUTPUT_DIR = os.path.join("BENCHMARKS", "results")
+
+
+def configure_environment(servers, work_dir):
+    """Points BACKEND/ at the fake servers and a scratch directory. Must run before importing it."""
+    os.environ.update({
+        "CLIPDROP_API_KEY": "offline-benchmark",
+        "OPENROUTER_API_KEY": "offline-benchmark",
+        "CLIPDROP_URL": servers.clipdrop_url,
+        "OPENROUTER_URL": servers.openrouter_url,
+        "IMAGE_CACHE_DIR": os.path.join(work_dir, "cache", "images"),
+        "PANEL_CACHE_DIR": os.path.join(work_dir, "cache", "panels"),
+        "PANEL_CACHE_DISABLED": "1",
+        "JOBS_DIR": os.path.join(work_dir, "jobs"),
+    })
+
+
+def summarize(samples):
+    """Returns min/median/p95/mean/max of a list of durations in seconds."""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    p95_index = min(len(ordered) - 1, round(0.95 * (len(ordered) - 1)))
+    return {
+        "runs": len(ordered),
+        "min": ordered[0],
+        "median": statistics.median(ordered),
+        "p95": ordered[p95_index],
+        "mean": statistics.fmean(ordered),
+        "max": ordered[-1],
+    }
+
+
+class Benchmark:
+    def __init__(self, work_dir):
+        # Imported here so configure_environment() has already set the URLs and keys
+        from BACKEND import export, generate_image, generate_panels, pipeline, process_comic
+
+        self.export = export
+        self.generate_image = generate_image
+        self.generate_panels = generate_panels
+        self.pipeline = pipeline
+        self.process_comic = process_comic
+        self.work_dir = work_dir
+        self.panels = None
+        self.images = None
+        self.comic = None
+
+    def reset_caches(self):
+        self.generate_image.IMAGE_CACHE.clear()
+        self.generate_panels.PANEL_CACHE.clear()
+
+    def prepare(self):
+        """Fetches one script and one set of images, as input for the stages that need them."""
+        self.panels = self.generate_panels.generate_panels(SCENARIO, ART_STYLE, use_cache=False)
+        results = self.generate_image.generate_panel_results(self.panels, ART_STYLE, use_cache=False, save_to_disk=False)
+        if any(result["Image"] is None for result in results):
+            # Failures are part of the flaky profiles; retry until the fixtures are complete
+            return self.prepare()
+        self.images = [result["Image"] for result in results]
+        self.comic = self.process_comic.create_comic_strip_with_text(self.images, self.texts())
+
+    def texts(self):
+        return [panel["Text"] for panel in self.panels]
+
+    def layout(self):
+        return self.process_comic.comic_layout_for(self.images)
+
+    def path(self, name):
+        return os.path.join(self.work_dir, name)
+
+    # Each stage returns a dictionary of extra facts about the run (may be empty)
+
+    def stage_panels(self):
+        panels = self.generate_panels.generate_panels(SCENARIO, ART_STYLE, use_cache=False)
+        return {"panels": len(panels)}
+
+    def stage_panels_stream(self):
+        start = time.perf_counter()
+        first_panel = None
+        count = 0
+        for _ in self.generate_panels.iter_panels(SCENARIO, ART_STYLE, use_cache=False):
+            if first_panel is None:
+                first_panel = time.perf_counter() - start
+            count += 1
+        return {"panels": count, "first_panel_seconds": first_panel}
+
+    def stage_images(self):
+        results = self.generate_image.generate_panel_results(self.panels, ART_STYLE, use_cache=False, save_to_disk=False)
+        return {"failed_panels": sum(1 for result in results if result["Image"] is None)}
+
+    def stage_compose(self):
+        comic = self.process_comic.create_comic_strip_with_text(self.images, self.texts())
+        return {"pixels": comic.width * comic.height}
+
+    def stage_compose_vertical(self):
+        path = self.path("vertical.png")
+        self.process_comic.create_comic_strip_with_text(self.images, self.texts(), path, is_vertical=True, stream=True)
+        return {"bytes": os.path.getsize(path)}
+
+    def stage_pdf(self):
+        path = self.export.create_pdf(self.comic, self.path("comic.pdf"), self.layout())
+        return {"bytes": os.path.getsize(path)}
+
+    def stage_export(self):
+        outputs = self.export.export_comic(
+            self.comic, self.path("comic.png"), pdf_path=self.path("export.pdf"),
+            preview_path=self.path("preview.jpg"), comic_layout=self.layout()
+        )
+        return {"bytes": {name: os.path.getsize(path) for name, path in outputs.items()}}
+
+    def stage_end_to_end(self):
+        result = self.pipeline.run_comic(SCENARIO, ART_STYLE)
+        return {
+            "bytes": {name: os.path.getsize(path) for name, path in result["outputs"].items()},
+            "preview_ready": result["timings"]["preview_ready"],
+        }
+
+    def run(self, stage, iterations, warmup=1):
+        """Times a stage; a failed run is counted and its error kept, not timed."""
+        method = getattr(self, f"stage_{stage}")
+        samples = []
+        errors = []
+        details = []
+        for i in range(warmup + iterations):
+            self.reset_caches()
+            start = time.perf_counter()
+            try:
+                info = method()
+            except Exception as e:
+                if i >= warmup:
+                    errors.append(str(e))
+                continue
+            elapsed = time.perf_counter() - start
+            if i >= warmup:
+                samples.append(elapsed)
+                details.append(info)
+        return {"seconds": summarize(samples), "errors": len(errors), "error_messages": errors[:5], "runs": details}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the comic pipeline offline against fake API servers.")
+    parser.add_argument("--profile", default="fast", choices=sorted(PROFILES))
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--stages", nargs="+", default=list(STAGES), choices=STAGES)
+    parser.add_argument("--output", help="Path of the JSON results (default: BENCHMARKS/results/<profile>-<time>.json)")
+    args = parser.parse_args()
+
+    with FakeServers(args.profile, args.seed) as servers, tempfile.TemporaryDirectory(prefix="comic-bench-") as work_dir:
+        configure_environment(servers, work_dir)
+        bench = Benchmark(work_dir)
+        bench.prepare()
+
+        results = {}
+        for stage in args.stages:
+            results[stage] = bench.run(stage, args.iterations, args.warmup)
+            timing = results[stage]["seconds"]
+            summary = f"median {timing['median']:.3f}s  p95 {timing['p95']:.3f}s" if timing else "no successful runs"
+            print(f"{stage:<18} {summary}  errors {results[stage]['errors']}")
+        server_stats = dict(servers.stats)
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "profile": args.profile,
+        "profile_settings": PROFILES[args.profile],
+        "iterations": args.iterations,
+        "warmup": args.warmup,
+        "seed": args.seed,
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "server": server_stats,
+        "stages": results,
+    }
+    output = args.output or os.path.join(DEFAULT_OUTPUT_DIR, f"{args.profile}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,36 @@
 import streamlit as st
 import os
 import random
-import base64
-from io import BytesIO
-from PIL import Image
-from reportlab.lib.pagesizes import A4
-from reportlab.platypus import SimpleDocTemplate, Image as RLImage, Spacer
-from BACKEND import generate_panels, generate_image, process_comic
+import time
+from BACKEND import artifacts, export, jobs, metrics, style_gallery
 
-def image_to_base64(img):
-    """Convert PIL Image to base64 string"""
-    buffered = BytesIO()
-    img.save(buffered, format="JPEG")
-    return base64.b64encode(buffered.getvalue()).decode()
+# Every generation writes into its own job directory; old ones are swept in the background
+artifacts.start_sweeper()
+# Prometheus metrics on /metrics, when METRICS_PORT is set
+metrics.start_http_server()
 
-PANEL_FOLDER = "PANEL_IMAGES"
-OUTPUT_FOLDER = "OUTPUT"
+JOB_POLL_INTERVAL = 0.5  # seconds between job status checks
 
-os.makedirs(PANEL_FOLDER, exist_ok=True)
-os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+STAGE_LABELS = {
+    "panels": "📝 Step 1: Brainstorming panel descriptions...",
+    "images": "🎨 Step 2: Drawing the artwork (this may take a moment)...",
+    "compose": "📐 Step 3: Assembling the final comic layout...",
+    "export": "📦 Step 4: Preparing your downloads...",
+}
+
+TIMING_LABELS = {
+    "panels": "📝 Panel script",
+    "images": "🎨 Artwork (after the script)",
+    "compose": "📐 Layout",
+    "export": "📦 Downloads",
+}
+
+DOWNLOAD_LABELS = {
+    "png": "📥 Download as PNG",
+    "webp": "📥 Download as WebP",
+    "jpeg": "📥 Download as JPEG",
+    "pdf": "� Download as PDF",
+}
 
 STYLE_DESCRIPTIONS = {
     "Manga": "High-contrast black and white sketch with sharp, clean lines, exaggerated facial expressions, and dramatic shading. No bright colors, only grayscale tones",
@@ -269,19 +281,16 @@ style_images = {
     "Anime": "SAMPLE_OUTPUT/ANIME.jpeg",
     "Belgian": "SAMPLE_OUTPUT/BELGIAN.jpeg",
 }
+# Built on the first run of the script, then served from memory on every rerun
+style_thumbnails = style_gallery.build_index(style_images.values())
 
 for idx, (style_name, col) in enumerate(zip(STYLE_DESCRIPTIONS.keys(), cols)):
     with col:
         selected_class = "selected" if st.session_state.selected_style == style_name else ""
-        try:
-            full_img = Image.open(style_images[style_name])
-            width, height = full_img.size
-            panel_width = width // 2
-            panel_height = height // 3
-            single_panel = full_img.crop((panel_width, 0, width, panel_height))
-            img_base64 = image_to_base64(single_panel)
+        img_base64 = style_thumbnails[style_images[style_name]]
+        if img_base64:
             img_html = f'<img src="data:image/jpeg;base64,{img_base64}" style="width:100%; max-height:130px; margin:auto; display:block; object-fit:contain; vertical-align:middle; border-radius:8px 8px 0 0; background:#fff;"/>'
-        except Exception as e:
+        else:
             img_html = '<div style="height: 110px; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); border-radius: 8px;"></div>'
         if st.button(f"{style_name}", key=f"style_btn_{idx}_{style_name}", use_container_width=True):
             st.session_state.selected_style = style_name
@@ -320,67 +329,165 @@ if st.button("🎨 Generate Comic", use_container_width=True, type="primary"):
             enhanced_prompt = f"Main Character: {character_desc}. Story: {user_prompt}"
         enhanced_prompt += f" Style: {grit_desc}, {tone_desc}."
         
-        with st.status("Creating your masterpiece...", expanded=True) as status:
-            st.write("📝 Step 1: Brainstorming panel descriptions...")
-            panel_data = generate_panels.generate_panels(enhanced_prompt, st.session_state.selected_style)
-            
-            st.write("🎨 Step 2: Drawing the artwork (this may take a moment)...")
-            image_paths = list(generate_image.generate_images(panel_data, art_style=st.session_state.selected_style))
-            
-            st.write("📐 Step 3: Assembling the final comic layout...")
-            panel_texts = [panel["Text"] for panel in panel_data] if include_speech_bubbles else [""] * 6
-            
-            if len(image_paths) == 6 and all(isinstance(img, str) and os.path.exists(img) for img in image_paths):
-                output_image_path = os.path.join(OUTPUT_FOLDER, "comic_strip_with_text.png")
-                
-                # Force 3x2 grid layout (horizontal)
-                is_vertical = False
-                process_comic.create_comic_strip_with_text(image_paths, panel_texts, output_image_path, is_vertical)
-                
-                status.update(label="✅ Comic Complete!", state="complete", expanded=False)
-                
-                # Center the comic strip with some spacing
-                st.markdown('<div style="height: 1.5rem;"></div>', unsafe_allow_html=True)
-                
-                # Create three columns with the middle one wider to center the image
-                col1, col2, col3 = st.columns([1, 2, 1])
-                with col2:
-                    st.image(output_image_path, width=400, caption="Your Generated Comic Strip")
-                    
-                st.markdown('<div style="height: 1rem;"></div>', unsafe_allow_html=True)
-                st.success("🎉 Comic generated successfully!")
-                
-                # PDF Generation
-                pdf_output_path = os.path.join(OUTPUT_FOLDER, "comic_strip.pdf")
-                def create_pdf(image_path, pdf_output_path):
-                    """Generate a PDF from the final comic strip"""
-                    doc = SimpleDocTemplate(pdf_output_path, pagesize=A4)
-                    img = RLImage(image_path, width=400, height=600)
-                    spacer = Spacer(1, 20)
-                    doc.build([img, spacer])
-                create_pdf(output_image_path, pdf_output_path)
-                
-                col1, col2 = st.columns(2)
-                with col1:
-                    with open(output_image_path, "rb") as img_file:
-                        st.download_button(
-                            label="📥 Download as PNG",
-                            data=img_file,
-                            file_name="comic_strip.png",
-                            mime="image/png",
-                            use_container_width=True
-                        )
-                with col2:
-                    with open(pdf_output_path, "rb") as pdf_file:
-                        st.download_button(
-                            label="� Download as PDF",
-                            data=pdf_file,
-                            file_name="comic_strip.pdf",
-                            mime="application/pdf",
-                            use_container_width=True
-                        )
+        try:
+            # Force 3x2 grid layout (horizontal)
+            job_id = jobs.submit_job(
+                enhanced_prompt,
+                st.session_state.selected_style,
+                include_text=include_speech_bubbles,
+                is_vertical=False,
+            )
+            # Keep the job ID in the URL too, so a browser refresh re-attaches to the running job
+            st.session_state.job_id = job_id
+            st.query_params["job"] = job_id
+        except jobs.QueueFullError as e:
+            st.error(f"⚠️ {e}")
+    else:
+        st.error("⚠️ Please enter a story prompt.")
+
+
+def show_comic(result):
+    """Shows the finished comic with its download buttons."""
+    # Center the comic strip with some spacing
+    st.markdown('<div style="height: 1.5rem;"></div>', unsafe_allow_html=True)
+    
+    # Create three columns with the middle one wider to center the image
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col2:
+        st.image(result["preview_path"], width=400, caption="Your Generated Comic Strip")
+        
+    st.markdown('<div style="height: 1rem;"></div>', unsafe_allow_html=True)
+    st.success("🎉 Comic generated successfully!")
+    
+    # The PNG/WebP/JPEG and PDF were all encoded by the job, off this thread
+    downloads = [
+        (name, path) for name, path in result["outputs"].items()
+        if name in export.OUTPUT_FORMATS
+    ]
+    downloads.append(("pdf", result["pdf_path"]))
+    for col, (name, path) in zip(st.columns(len(downloads)), downloads):
+        with col:
+            with open(path, "rb") as download_file:
+                st.download_button(
+                    label=DOWNLOAD_LABELS.get(name, f"📥 Download as {name.upper()}"),
+                    data=download_file,
+                    file_name=f"comic_strip.{os.path.splitext(path)[1][1:]}",
+                    mime=export.OUTPUT_FORMATS[name]["mime"] if name in export.OUTPUT_FORMATS else "application/pdf",
+                    use_container_width=True
+                )
+
+    edit_panel(result)
+
+    timings = result.get("timings")
+    if timings:
+        with st.expander(f"⏱️ Generated in {timings['total']:.1f}s"):
+            for stage, label in TIMING_LABELS.items():
+                seconds = timings.get(stage, 0.0)
+                share = seconds / timings["total"] if timings["total"] else 0.0
+                st.write(f"{label}: **{seconds:.2f}s**")
+                st.progress(min(share, 1.0))
+            if "preview_ready" in timings:
+                st.caption(f"👀 The preview was ready after {timings['preview_ready']:.1f}s.")
+
+
+def edit_panel(result):
+    """Lets the user fix one panel: a new caption is redrawn in place, a new image costs one image call."""
+    panels = result.get("panels") or []
+    if not panels:
+        return
+    with st.expander("✏️ Fix a panel"):
+        number = st.selectbox("Panel", range(1, len(panels) + 1), format_func=lambda n: f"Panel {n}", key="edit_panel_number")
+        panel = panels[number - 1]
+        text = st.text_input("Caption", value=panel["Text"], key=f"edit_panel_text_{number}")
+        description = st.text_area("Scene", value=panel["Description"], height=80, key=f"edit_panel_description_{number}")
+
+        caption_col, redraw_col = st.columns(2)
+        changes = None
+        with caption_col:
+            if st.button("💬 Update caption", use_container_width=True, disabled=text == panel["Text"]):
+                changes = {"text": text}
+        with redraw_col:
+            if st.button("🎨 Redraw this panel", use_container_width=True):
+                changes = {"text": text if text != panel["Text"] else None, "regenerate": True}
+                if description != panel["Description"]:
+                    changes["description"] = description
+
+        if changes is not None:
+            try:
+                jobs.submit_edit(result["job_id"], number - 1, **changes)
+            except ValueError as e:
+                st.warning(f"⚠️ {e}")
             else:
-                status.update(label="❌ Generation Failed", state="error", expanded=False)
-                st.error("❌ Something went wrong! Please try again later.")
+                st.rerun()
+
+
+def panel_grid(container, count, columns=2):
+    """Lays out empty placeholders for `count` panels and returns them in panel order."""
+    slots = []
+    with container:
+        for row_start in range(0, count, columns):
+            for col in st.columns(columns):
+                if len(slots) < count:
+                    slot = col.empty()
+                    slot.caption(f"⏳ Panel {len(slots) + 1}")
+                    slots.append(slot)
+    return slots
+
+
+def show_job(job_id):
+    """Polls a background job, showing per-stage progress until it finishes."""
+    job = jobs.get_job(job_id)
+    if job is None:
+        st.warning("⚠️ This comic is no longer available. Please generate it again.")
+        st.session_state.pop("job_id", None)
+        st.query_params.pop("job", None)
+        return
+
+    with st.status("Creating your masterpiece...", expanded=job["status"] != "done") as status:
+        stage_text = st.empty()
+        progress_bar = st.progress(0.0)
+        grid = st.container()
+        preview_slot = st.empty()
+        panel_slots = []
+        shown_panels = set()
+        shown_preview = False
+        while job["status"] in ("queued", "running"):
+            stage_text.write(STAGE_LABELS.get(job["stage"], "⏳ Waiting for a free artist..."))
+            progress_bar.progress(min(job["percent"], 1.0))
+
+            # Fill in the 3x2 grid in place as each panel arrives
+            if job["panel_images"] and not panel_slots:
+                panel_slots = panel_grid(grid, len(job["panel_images"]))
+            for index, preview in enumerate(job["panel_images"]):
+                if preview is not None and index not in shown_panels:
+                    panel_slots[index].image(preview, caption=f"Panel {index+1}", use_container_width=True)
+                    shown_panels.add(index)
+
+            # The quick preview of the whole comic, while the full-resolution files are rendered
+            if job["preview_path"] and not shown_preview:
+                preview_slot.image(job["preview_path"], width=400, caption="Preview - finishing the full-size comic...")
+                shown_preview = True
+
+            time.sleep(JOB_POLL_INTERVAL)
+            job = jobs.get_job(job_id)
+
+        progress_bar.progress(1.0)
+        if job["status"] == "done":
+            stage_text.write("📐 All steps finished.")
+            status.update(label="✅ Comic Complete!", state="complete", expanded=False)
+        else:
+            stage_text.write(job["error"])
+            status.update(label="❌ Generation Failed", state="error", expanded=False)
+
+    if job["status"] == "done":
+        if job["error"]:
+            st.warning(f"⚠️ The panel could not be changed: {job['error']}")
+        show_comic(job["result"])
     else:
-        st.error("⚠️ Please enter a story prompt.")
\ No newline at end of file
+        st.error("❌ Something went wrong! Please try again later.")
+
+
+current_job_id = st.session_state.get("job_id") or st.query_params.get("job")
+if current_job_id:
+    st.session_state.job_id = current_job_id
+    show_job(current_job_id)